@@ -6,4 +6,5 @@ class AccountConfig(AppConfig):
     verbose_name = '用户管理'
 
     def ready(self):
+        import account.checks
         import account.signals.handlers
\ No newline at end of file
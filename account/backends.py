@@ -5,10 +5,20 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
+from rest_framework.request import Request
+
+from .cache import cached_permissions
+from .catalog import encode_permissions, get_permission_catalog
+from .hashing import check_password, make_password
+from .models import UserEffectivePermission
+from .settings import account_settings
 
 
 UserModel = get_user_model()
 
+# 权限的四个来源，顺序与 get_all_permissions 合并的顺序一致
+PERMISSION_SOURCES = ('user', 'group', 'room', 'department')
+
 
 class MyBackend(ModelBackend):
     """
@@ -21,25 +31,92 @@ class MyBackend(ModelBackend):
         get_all_permissions
 
     自定义的方法：
+        _get_room_permissions
+        _get_department_permissions
+        _get_all_permissions
+        _get_materialized_permissions
+        _resolve_all_permissions
+        _resolve_permission_mask
+        get_room_permissions
+        get_department_permissions
+
+    authenticate 与 ModelBackend 相同，但 DRF 的请求（/jwt/auth/）中密码哈希在 account.hashing 的线程池中计算
     """
 
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # 线程池满时抛出的 LoginBusy 是 DRF 的异常，只有 DRF 的视图会转换为 503，
+        # admin 登录等其他调用者使用 ModelBackend 原来的实现
+        if not isinstance(request, Request):
+            return super().authenticate(request, username, password, **kwargs)
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # 用户不存在时也计算一次哈希，避免通过响应时间判断用户是否存在
+            make_password(password)
+        else:
+            if check_password(user, password) and self.user_can_authenticate(user):
+                return user
+
+    # 以下查询都只用 user_obj.pk，user_obj 也可以是 account.principal.Principal
+
     def _get_user_permissions(self, user_obj):
-        return user_obj.user_permissions.all()
+        user_permissions_field = get_user_model()._meta.get_field('user_permissions')
+        user_permissions_query = user_permissions_field.related_query_name()
+        return Permission.objects.filter(**{user_permissions_query: user_obj.pk})
 
     def _get_group_permissions(self, user_obj):
         user_groups_field = get_user_model()._meta.get_field('groups')
         user_groups_query = 'group__%s' % user_groups_field.related_query_name()
-        return Permission.objects.filter(**{user_groups_query: user_obj})
+        return Permission.objects.filter(**{user_groups_query: user_obj.pk})
 
     def _get_room_permissions(self, user_obj):
         '''
         返回成员所在科室的权限，注意用户科室是多对一
         '''
-        return Permission.objects.filter(room__users=user_obj)
+        return Permission.objects.filter(room__users=user_obj.pk)
 
     def _get_department_permissions(self, user_obj):
-        return Permission.objects.filter(department__rooms__users=user_obj)
+        return Permission.objects.filter(department__rooms__users=user_obj.pk)
 
+    def _get_all_permissions(self, user_obj):
+        '''
+        一条查询取出用户的全部权限：
+        超级用户直接取权限目录中的所有权限，其他用户把四个来源 UNION 到一起
+        '''
+        if user_obj.is_superuser:
+            return set(get_permission_catalog().index)
+
+        querysets = [
+            getattr(self, '_get_%s_permissions' % from_name)(user_obj)
+            .values_list('content_type__app_label', 'codename').order_by()
+            for from_name in PERMISSION_SOURCES
+        ]
+        perms = querysets[0].union(*querysets[1:])
+        return {"%s.%s" % (ct, name) for ct, name in perms}
+
+    def _get_materialized_permissions(self, user_obj):
+        '''
+        从物化表中取出用户的全部权限，按 user_id 走索引
+        '''
+        perms = UserEffectivePermission.objects.filter(user_id=user_obj.pk).values_list(
+            'permission__content_type__app_label', 'permission__codename').order_by()
+        return {"%s.%s" % (ct, name) for ct, name in perms}
+
+    def _resolve_all_permissions(self, user_obj):
+        if account_settings.PERMISSION_RESOLUTION == 'union':
+            return self._get_all_permissions(user_obj)
+        if account_settings.PERMISSION_RESOLUTION == 'materialized':
+            return self._get_materialized_permissions(user_obj)
+        return {
+            *self.get_user_permissions(user_obj),
+            *self.get_group_permissions(user_obj),
+            *self.get_room_permissions(user_obj),
+            *self.get_department_permissions(user_obj),
+        }
 
     def _get_permissions(self, user_obj, obj, from_name):
         """
@@ -60,6 +137,9 @@ class MyBackend(ModelBackend):
             setattr(user_obj, perm_cache_name, {"%s.%s" % (ct, name) for ct, name in perms})
         return getattr(user_obj, perm_cache_name)
 
+    def _resolve_permission_mask(self, user_obj):
+        return encode_permissions(self._resolve_all_permissions(user_obj))
+
     def get_user_permissions(self, user_obj, obj=None):
         """
         Return a set of permission strings the user `user_obj` has from their
@@ -84,10 +164,16 @@ class MyBackend(ModelBackend):
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
         if not hasattr(user_obj, '_perm_cache'):
-            user_obj._perm_cache = {
-                *self.get_user_permissions(user_obj),
-                *self.get_group_permissions(user_obj),
-                *self.get_room_permissions(user_obj),
-                *self.get_department_permissions(user_obj),
-            }
-        return user_obj._perm_cache
\ No newline at end of file
+            # 先查跨请求的缓存，未命中时才解析
+            if account_settings.PERMISSION_ENCODING == 'bitmask':
+                mask = cached_permissions(user_obj, self._resolve_permission_mask, 'bitmask')
+                user_obj._perm_cache = get_permission_catalog().decode(mask)
+            else:
+                user_obj._perm_cache = cached_permissions(user_obj, self._resolve_all_permissions)
+        return user_obj._perm_cache
+
+    def has_perm(self, user_obj, perm, obj=None):
+        # 超级用户不必解析权限
+        if user_obj.is_active and user_obj.is_superuser and obj is None:
+            return True
+        return super().has_perm(user_obj, perm, obj)
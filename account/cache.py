@@ -0,0 +1,154 @@
+"""
+用户有效权限的跨请求缓存
+
+缓存键带有版本号： account:perms:<格式>:<user_id>:<全局版本>.<用户版本>
+权限来源（部门、科室、团队、用户授权）变化时，signals 提升相关用户的版本号，
+旧的缓存不再被读取，等待过期即可，所以缓存中的权限永远不会过时。
+部门/科室等影响面大的变化只提升对应用户的版本；无法确定影响范围时提升全局版本。
+导航菜单同样按权限版本缓存。
+"""
+
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import get_language
+from rest_framework_jwt.utils import jwt_decode_cache
+
+from .settings import account_settings
+
+
+GLOBAL_VERSION_KEY = 'account:perm-version'
+USER_VERSION_KEY = 'account:perm-version:%s'
+PERMISSIONS_KEY = 'account:perms:%s:%s:%s'
+MENU_KEY = 'account:menu:%s:%s:%s:%s'
+
+
+class CacheStats:
+    """
+    缓存的命中/未命中计数，按进程统计
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def hit(self):
+        with self.lock:
+            self.hits += 1
+
+    def miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def reset(self):
+        with self.lock:
+            self.hits = self.misses = 0
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+        }
+
+
+permission_stats = CacheStats()
+menu_stats = CacheStats()
+
+# /account/cache-stats/ 中展示的计数
+CACHE_STATS = {
+    'permissions': permission_stats,
+    'menu': menu_stats,
+    'jwt_decode': jwt_decode_cache,
+}
+
+
+def get_cache():
+    alias = account_settings.PERMISSION_CACHE
+    return caches[alias] if alias else None
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_permission_version(user_id):
+    """
+    返回用户当前的权限版本，版本号不存在时初始化
+    """
+    cache = get_cache()
+    keys = [GLOBAL_VERSION_KEY, USER_VERSION_KEY % user_id]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return '%s.%s' % (versions[GLOBAL_VERSION_KEY], versions[USER_VERSION_KEY % user_id])
+
+
+def _bump(user_ids):
+    cache = get_cache()
+    if cache is None:
+        return
+    if user_ids is None:
+        cache.set(GLOBAL_VERSION_KEY, _new_version(), None)
+    else:
+        cache.set_many({USER_VERSION_KEY % pk: _new_version() for pk in user_ids}, None)
+
+
+def bump_permission_version(user_ids=None):
+    """
+    提升用户的权限版本，user_ids 为 None 时提升全局版本（所有用户失效）
+
+    立即提升一次，事务提交后再提升一次：
+    避免其他请求在提交前读到旧数据，又用新版本号写入缓存
+    """
+    if user_ids is not None:
+        user_ids = list(user_ids)
+    _bump(user_ids)
+    transaction.on_commit(lambda: _bump(user_ids))
+
+
+def cached_permissions(user_obj, resolve, encoding='set'):
+    """
+    从缓存中取用户的有效权限，未命中时调用 resolve(user_obj) 并写入缓存
+    先读版本号再查数据库，保证写入的权限不会比版本号旧
+    encoding 区分缓存值的格式（set 或 bitmask），切换格式时不会读到另一种格式的值
+    """
+    cache = get_cache()
+    if cache is None:
+        return resolve(user_obj)
+
+    key = PERMISSIONS_KEY % (encoding, user_obj.pk, get_permission_version(user_obj.pk))
+    perms = cache.get(key)
+    if perms is None:
+        permission_stats.miss()
+        perms = resolve(user_obj)
+        cache.set(key, perms, account_settings.PERMISSION_CACHE_TIMEOUT)
+    else:
+        permission_stats.hit()
+    return perms
+
+
+def cached_menu(user_obj, build, version):
+    """
+    从缓存中取用户的导航菜单，未命中时调用 build(user_obj)
+    version 是菜单依赖的其他数据（内容类型目录）的版本
+    """
+    cache = get_cache()
+    if cache is None or user_obj.pk is None:
+        return build(user_obj)
+
+    key = MENU_KEY % (user_obj.pk, get_permission_version(user_obj.pk), version, get_language())
+    menu = cache.get(key)
+    if menu is None:
+        menu_stats.miss()
+        menu = build(user_obj)
+        cache.set(key, menu, account_settings.PERMISSION_CACHE_TIMEOUT)
+    else:
+        menu_stats.hit()
+    return menu
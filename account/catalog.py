@@ -0,0 +1,249 @@
+"""
+权限目录和内容类型目录
+
+每个 Permission 以主键作为稳定的整数下标，用户的有效权限可以编码为一个整数位图：
+    1 << permission.pk
+位图可以直接放进缓存，has_perm 只是一次字典查找加一次位运算。
+
+目录在每个进程中只加载一次。Permission、ContentType 变化或 migrate 之后由 signals 使其失效，
+同时在缓存中更新目录的代号（generation），其他进程每隔 CATALOG_CHECK_INTERVAL 秒
+比较一次代号，发现变化后重新加载。
+没有配置共享的缓存时，代号是数据库中各行（主键和名称等列）的摘要，改名也能发现，
+每次比较是一条只读这几列的查询。
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Set
+
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+
+from .cache import get_cache
+from .checks import is_local_cache
+from .settings import account_settings
+
+
+GENERATION_KEY = 'account:catalog-generation:%s'
+
+
+class PermissionCatalog:
+    """
+    权限名（app_label.codename）与下标之间的映射
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows)
+        self.index = {f'{app_label}.{codename}': pk for pk, app_label, codename in rows}
+        self.names = {pk: name for name, pk in self.index.items()}
+        self.codenames = defaultdict(list)
+        for name in self.index:
+            self.codenames[name.split('.', 1)[1]].append(name)
+        digest = hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+        self.version = digest[:12]
+
+    @classmethod
+    def load(cls):
+        rows = Permission.objects.values_list('pk', 'content_type__app_label', 'codename').order_by()
+        return cls(rows)
+
+    def __contains__(self, perm):
+        return perm in self.index
+
+    def by_codename(self, codename):
+        """
+        codename 相同的权限可能属于不同的应用，返回全部的权限名
+        """
+        return self.codenames.get(codename, [])
+
+    def encode(self, perms):
+        mask = 0
+        for perm in perms:
+            mask |= 1 << self.index[perm]
+        return mask
+
+    def decode(self, mask):
+        return PermissionSet(mask, self)
+
+
+class PermissionSet(Set):
+    """
+    只读的权限集合，内部是一个位图，可以和普通的 set 比较、合并
+    """
+    __slots__ = ('mask', 'catalog')
+
+    def __init__(self, mask, catalog):
+        self.mask = mask
+        self.catalog = catalog
+
+    def __contains__(self, perm):
+        index = self.catalog.index.get(perm)
+        return index is not None and bool(self.mask >> index & 1)
+
+    def __iter__(self):
+        mask, names = self.mask, self.catalog.names
+        while mask:
+            low = mask & -mask
+            name = names.get(low.bit_length() - 1)
+            if name is not None:
+                yield name
+            mask ^= low
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    @classmethod
+    def _from_iterable(cls, it):
+        # 集合运算（&、| 等）的结果用普通的 set
+        return set(it)
+
+    def __repr__(self):
+        return f'PermissionSet({set(self)!r})'
+
+    def to_bytes(self):
+        return self.mask.to_bytes((self.mask.bit_length() + 7) // 8, 'little')
+
+    @classmethod
+    def from_bytes(cls, data, catalog):
+        return cls(int.from_bytes(data, 'little'), catalog)
+
+
+class ContentTypeCatalog:
+    """
+    所有的 ContentType，按 (app_label, model) 索引
+    """
+    # 权限矩阵中不显示的应用
+    matrix_excluded_apps = ('sessions', 'contenttypes', 'auth', 'admin')
+    matrix_actions = ('view', 'add', 'change', 'delete')
+
+    def __init__(self, content_types):
+        self.content_types = list(content_types)
+        self.index = {(ct.app_label, ct.model): ct for ct in self.content_types}
+        rows = [(ct.pk, ct.app_label, ct.model) for ct in self.content_types]
+        self.version = hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()[:12]
+        # 权限矩阵的每一行预先算好四个权限名
+        self.matrix_rows = [
+            (ct.app_label, ct.model, tuple(f'{ct.app_label}.{action}_{ct.model}' for action in self.matrix_actions))
+            for ct in self.content_types
+            if ct.app_label not in self.matrix_excluded_apps
+        ]
+
+    @classmethod
+    def load(cls):
+        return cls(ContentType.objects.order_by('pk'))
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, app_label, model):
+        return self.index.get((app_label, model))
+
+    def permission_matrix(self, perms, superuser=False):
+        """
+        由用户的权限集合一次生成 {app: {model: {view, add, change, delete}}}，
+        有 change 权限时 view 也为 True，超级用户全部为 True
+        """
+        matrix = {}
+        for app_label, model, names in self.matrix_rows:
+            if superuser:
+                row = dict.fromkeys(self.matrix_actions, True)
+            else:
+                row = {action: name in perms for action, name in zip(self.matrix_actions, names)}
+                row['view'] = row['view'] or row['change']
+            matrix.setdefault(app_label, {})[model] = row
+        return matrix
+
+
+class LazyCatalog:
+    """
+    进程内只加载一次的目录，失效后下次访问时重新加载
+    """
+
+    def __init__(self, name, loader, model, fields):
+        self.key = GENERATION_KEY % name
+        self.loader = loader
+        self.model = model
+        # 没有共享缓存时计算代号的列，包含目录中用到的全部列
+        self.fields = fields
+        self.value = None
+        self.generation = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def shared_generation(self):
+        """
+        其他进程也能看到的目录代号：共享缓存中的代号，
+        没有配置缓存或缓存只在本进程内有效时，使用数据库中各行的摘要
+        """
+        cache = get_cache()
+        if cache is None or is_local_cache(account_settings.PERMISSION_CACHE):
+            rows = self.model.objects.order_by('pk').values_list(*self.fields)
+            return 'db:' + hashlib.sha1(repr(list(rows)).encode('utf-8')).hexdigest()
+        generation = cache.get(self.key)
+        if generation is None:
+            cache.add(self.key, uuid.uuid4().hex, None)
+            generation = cache.get(self.key)
+        return generation
+
+    def get(self):
+        now = time.monotonic()
+        if self.value is not None and now - self.checked >= account_settings.CATALOG_CHECK_INTERVAL:
+            self.checked = now
+            if self.shared_generation() != self.generation:
+                self.value = None
+
+        value = self.value
+        if value is None:
+            with self.lock:
+                if self.value is None:
+                    # 先读代号再加载，加载期间目录再变化时下次检查会发现
+                    self.generation = self.shared_generation()
+                    self.value = self.loader()
+                    self.checked = now
+                value = self.value
+        return value
+
+    def invalidate(self):
+        self.value = None
+        cache = get_cache()
+        if cache is not None and not is_local_cache(account_settings.PERMISSION_CACHE):
+            cache.set(self.key, uuid.uuid4().hex, None)
+
+
+_permission_catalog = LazyCatalog('permission', PermissionCatalog.load, Permission,
+                                  ('pk', 'content_type__app_label', 'codename', 'name'))
+_content_type_catalog = LazyCatalog('contenttype', ContentTypeCatalog.load, ContentType,
+                                    ('pk', 'app_label', 'model'))
+
+
+def get_permission_catalog():
+    return _permission_catalog.get()
+
+
+def get_content_type_catalog():
+    return _content_type_catalog.get()
+
+
+def invalidate_permission_catalog(**kwargs):
+    _permission_catalog.invalidate()
+
+
+def invalidate_content_type_catalog(**kwargs):
+    _content_type_catalog.invalidate()
+
+
+def encode_permissions(perms):
+    """
+    把权限名的集合编码为位图，目录中没有的权限说明目录过时了，重新加载一次
+    """
+    catalog = get_permission_catalog()
+    if isinstance(perms, PermissionSet) and perms.catalog is catalog:
+        return perms.mask
+    if not all(perm in catalog for perm in perms):
+        invalidate_permission_catalog()
+        catalog = get_permission_catalog()
+        perms = [perm for perm in perms if perm in catalog]
+    return catalog.encode(perms)
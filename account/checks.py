@@ -0,0 +1,48 @@
+"""
+系统检查：跨请求的缓存必须是所有进程共享的
+
+signals 只在处理修改的进程中失效缓存，进程内的 LocMemCache 在其他进程中不会失效，
+权限、菜单、JWT 认证的用户等会一直使用旧的数据，直到缓存过期。
+"""
+
+from django.conf import settings
+from django.core.checks import Error, register
+from rest_framework_jwt.settings import api_settings
+
+from .settings import account_settings
+
+
+# 只在当前进程内有效的缓存
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def is_local_cache(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_CACHE_BACKENDS
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    errors = []
+    alias = account_settings.PERMISSION_CACHE
+    if alias and is_local_cache(alias):
+        errors.append(Error(
+            f"ACCOUNT['PERMISSION_CACHE'] 使用了进程内的缓存 {alias!r}",
+            hint='配置 Redis、Memcached 等所有进程共享的缓存，或设为 None 不缓存权限',
+            id='account.E001',
+        ))
+    alias = api_settings.JWT_USER_CACHE
+    if alias and is_local_cache(alias):
+        errors.append(Error(
+            f"JWT_AUTH['JWT_USER_CACHE'] 使用了进程内的缓存 {alias!r}",
+            hint='配置 Redis、Memcached 等所有进程共享的缓存，或设为 None 不缓存用户',
+            id='account.E002',
+        ))
+    if api_settings.JWT_GET_USER_SECRET_KEY and (api_settings.JWT_SIGNING_KEYS or api_settings.JWT_PRIVATE_KEY):
+        errors.append(Error(
+            "JWT_AUTH['JWT_GET_USER_SECRET_KEY'] 不能与 JWT_SIGNING_KEYS、JWT_PRIVATE_KEY 同时使用",
+            hint='用私钥签名的 token 不使用用户的密钥，User.rotate_secret() 不能使这些 token 失效',
+            id='account.E003',
+        ))
+    return errors
@@ -0,0 +1,131 @@
+"""
+维护用户有效权限的物化表 UserEffectivePermission
+
+权限来源（用户授权、团队、科室、部门）变化时，由 signals 调用 permissions_changed，
+只重新计算受影响的用户，并只写入有差异的行。
+全量重建和漂移检查见 manage.py rebuild_effective_permissions。
+"""
+
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+
+from .cache import bump_permission_version
+from .catalog import get_permission_catalog
+from .models import Department, Room, UserEffectivePermission
+from .settings import account_settings
+
+
+UserModel = get_user_model()
+
+# 每批处理的用户数，避免 IN 查询的参数过多
+BATCH_SIZE = 500
+
+
+def _batches(user_ids):
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), BATCH_SIZE):
+        yield user_ids[i:i + BATCH_SIZE]
+
+
+def _group_by(queryset, key_field, value_field):
+    result = defaultdict(set)
+    for key, value in queryset.values_list(key_field, value_field):
+        result[key].add(value)
+    return result
+
+
+def resolve_effective_permissions(user_ids):
+    """
+    返回 {user_id: {permission_id}}，查询数固定，与用户数无关
+    """
+    users = UserModel.objects.filter(pk__in=user_ids).values_list(
+        'pk', 'is_superuser', 'room_id', 'room__department_id')
+    result = {}
+    rooms, departments = {}, {}
+    for pk, is_superuser, room_id, department_id in users:
+        result[pk] = set()
+        if is_superuser:
+            continue
+        rooms[pk] = room_id
+        departments[pk] = department_id
+
+    if len(rooms) < len(result):
+        all_permissions = set(get_permission_catalog().names)
+        for pk in result.keys() - rooms.keys():
+            result[pk] = set(all_permissions)
+
+    if not rooms:
+        return result
+
+    user_perms = _group_by(UserModel.user_permissions.through.objects.filter(user_id__in=rooms),
+                           'user_id', 'permission_id')
+    user_groups = _group_by(UserModel.groups.through.objects.filter(user_id__in=rooms),
+                            'user_id', 'group_id')
+    group_perms = _group_by(
+        Group.permissions.through.objects.filter(group_id__in={g for gs in user_groups.values() for g in gs}),
+        'group_id', 'permission_id')
+    room_perms = _group_by(Room.permissions.through.objects.filter(room_id__in=set(rooms.values())),
+                           'room_id', 'permission_id')
+    department_perms = _group_by(
+        Department.permissions.through.objects.filter(department_id__in=set(departments.values())),
+        'department_id', 'permission_id')
+
+    for pk in rooms:
+        perms = result[pk]
+        perms |= user_perms[pk]
+        for group_id in user_groups[pk]:
+            perms |= group_perms[group_id]
+        perms |= room_perms[rooms[pk]]
+        perms |= department_perms[departments[pk]]
+    return result
+
+
+def diff_effective_permissions(user_ids):
+    """
+    比较物化表和实际权限，返回 (缺少的行, 多余行的 pk)
+    """
+    missing, stale = [], []
+    for batch in _batches(user_ids):
+        expected = resolve_effective_permissions(batch)
+        existing = set()
+        rows = UserEffectivePermission.objects.filter(user_id__in=batch)
+        for pk, user_id, permission_id in rows.values_list('pk', 'user_id', 'permission_id'):
+            if permission_id in expected.get(user_id, ()):
+                existing.add((user_id, permission_id))
+            else:
+                stale.append(pk)
+        missing.extend(
+            UserEffectivePermission(user_id=user_id, permission_id=permission_id)
+            for user_id, perms in expected.items()
+            for permission_id in perms
+            if (user_id, permission_id) not in existing
+        )
+    return missing, stale
+
+
+def refresh_effective_permissions(user_ids=None):
+    """
+    重新计算用户的有效权限，只写入差异，user_ids 为 None 时处理全部用户
+    返回 (新增行数, 删除行数)
+    """
+    if user_ids is None:
+        user_ids = UserModel.objects.values_list('pk', flat=True).order_by('pk')
+    missing, stale = diff_effective_permissions(user_ids)
+    for batch in _batches(stale):
+        UserEffectivePermission.objects.filter(pk__in=batch).delete()
+    UserEffectivePermission.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+    return len(missing), len(stale)
+
+
+def permissions_changed(user_ids=None):
+    """
+    权限来源变化后调用：提升权限缓存的版本，物化模式下同步物化表
+    user_ids 为 None 表示影响范围未知，所有用户都要重新计算
+    """
+    if user_ids is not None:
+        user_ids = list(user_ids)
+    bump_permission_version(user_ids)
+    if account_settings.PERMISSION_RESOLUTION == 'materialized':
+        refresh_effective_permissions(user_ids)
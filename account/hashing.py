@@ -0,0 +1,146 @@
+"""
+登录时的密码哈希在有界的线程池中计算
+
+PBKDF2 计算时释放 GIL，放在线程池中可以限制同时计算哈希的数量，
+登录高峰（例如交接班）时其他接口仍有空闲的 CPU。
+线程池满（LOGIN_HASH_WORKERS 个正在计算，LOGIN_HASH_QUEUE 个在排队）时
+直接返回 503 和 Retry-After，不再排队等待。
+
+只有哈希在线程池中计算，查询、保存用户仍在请求的线程中，使用请求的数据库连接。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .settings import account_settings
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = '登录的用户过多，请稍后重试'
+    default_code = 'login_busy'
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF 的异常处理根据 wait 设置 Retry-After
+        self.wait = wait
+
+
+class HashingStats:
+    """
+    排队等待时间和哈希计算时间，按进程统计，单位毫秒
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.completed = 0
+            self.rejected = 0
+            self.wait_total = self.wait_max = 0.0
+            self.hash_total = self.hash_max = 0.0
+
+    def record(self, wait, elapsed):
+        with self.lock:
+            self.completed += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.hash_total += elapsed
+            self.hash_max = max(self.hash_max, elapsed)
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+
+    def as_dict(self):
+        completed = self.completed or 1
+        return {
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_avg_ms': round(self.wait_total / completed * 1000, 3),
+            'wait_max_ms': round(self.wait_max * 1000, 3),
+            'hash_avg_ms': round(self.hash_total / completed * 1000, 3),
+            'hash_max_ms': round(self.hash_max * 1000, 3),
+        }
+
+
+class HashingPool:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config = None
+        self.executor = None
+        self.slots = None
+        self.stats = HashingStats()
+
+    def _get_executor(self):
+        config = (account_settings.LOGIN_HASH_WORKERS, account_settings.LOGIN_HASH_QUEUE)
+        with self.lock:
+            if self.config != config:
+                # 配置变化（测试中 override_settings）时重新创建
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.executor = ThreadPoolExecutor(config[0], thread_name_prefix='login-hash')
+                self.slots = threading.BoundedSemaphore(config[0] + config[1])
+                self.config = config
+            return self.executor, self.slots
+
+    def run(self, func, *args):
+        """
+        在线程池中执行 func(*args) 并等待结果，线程池已满时抛出 LoginBusy
+        LOGIN_HASH_WORKERS 为 0 时直接在当前线程执行
+        """
+        if not account_settings.LOGIN_HASH_WORKERS:
+            return func(*args)
+
+        executor, slots = self._get_executor()
+        if not slots.acquire(blocking=False):
+            self.stats.reject()
+            raise LoginBusy(account_settings.LOGIN_HASH_RETRY_AFTER)
+
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.stats.record(started - submitted, time.perf_counter() - started)
+                slots.release()
+
+        return executor.submit(task).result()
+
+
+hashing_pool = HashingPool()
+
+
+def make_password(raw_password):
+    return hashing_pool.run(hashers.make_password, raw_password)
+
+
+def check_password(user, raw_password):
+    """
+    与 AbstractBaseUser.check_password 相同，但哈希在线程池中计算：
+    密码正确且哈希算法或迭代次数已变化时，重新计算哈希并保存，
+    线程池已满时保留旧的哈希，下次登录再更新
+    """
+    encoded = user.password
+    if not hashing_pool.run(hashers.check_password, raw_password, encoded):
+        return False
+
+    preferred = hashers.get_hasher()
+    hasher = hashers.identify_hasher(encoded)
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        try:
+            user.password = make_password(raw_password)
+        except LoginBusy:
+            return True
+        user.save(update_fields=['password'])
+    return True
@@ -0,0 +1,356 @@
+"""
+从 CSV 或 JSON 批量导入用户
+
+每行（或每个 JSON 对象）一个用户，按 username 更新已有的用户、创建新用户，重复导入结果不变：
+
+    username,password,realname,email,mobile,gender,job,brief,is_active,is_staff,room,department,groups,permissions
+    zhangsan,cec123456,张三,,,M,,,,,cim,it,"开发,运维",account.view_user
+
+- room、department 是科室、部门的代码，department 只用于校验科室所属的部门
+- groups 是团队名称，permissions 是 app_label.codename，CSV 中用逗号分隔，JSON 中是列表
+- 空值表示不修改（新用户使用默认值），JSON 中的 [] 表示清空团队或权限
+- 新用户没有密码时不能用密码登录；已有用户只有指定 update_passwords 时才修改密码
+
+先校验全部的行，有错误时不写入任何数据。
+用户用 bulk_create/bulk_update 写入，团队和权限直接写入中间表，只写有差异的行。
+批量操作不会触发 signals，写入后调用 permissions_changed、invalidate_cached_user 和 index_users。
+密码哈希在线程池中并行计算（PBKDF2 计算时释放 GIL）。
+
+命令见 manage.py import_users，admin 中见用户列表的“导入用户”。
+"""
+
+import csv
+import json
+import os
+import secrets
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model, hashers
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework_jwt.cache import invalidate_cached_user
+
+from .catalog import get_permission_catalog
+from .effective import permissions_changed
+from .models import Department, Room
+from .search import index_users
+
+
+UserModel = get_user_model()
+
+BATCH_SIZE = 500
+FORMATS = ('csv', 'json')
+
+FIELDS = ('realname', 'email', 'mobile', 'gender', 'job', 'brief')
+BOOLEAN_FIELDS = ('is_active', 'is_staff')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', '是'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', '否'}
+
+
+class ImportFailed(Exception):
+    """
+    校验失败，errors 是 [(行号, 错误信息)]
+    """
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} 个错误')
+        self.errors = errors
+
+
+def read_rows(file, import_format):
+    """
+    读取文本文件，返回 [(行号, 字典)]
+    JSON 可以是一个列表，也可以是每行一个对象（NDJSON）
+    文件格式错误时抛出 ImportFailed，不是 UTF-8 编码时抛出 ValueError
+    """
+    try:
+        if import_format == 'csv':
+            return _read_csv(file)
+        return _read_json(file)
+    except UnicodeDecodeError:
+        raise ValueError('文件不是 UTF-8 编码')
+
+
+def _read_csv(file):
+    reader = csv.DictReader(file)
+    try:
+        return [(reader.line_num, row) for row in reader]
+    except csv.Error as e:
+        # 出错的行还没有计入 line_num
+        raise ImportFailed([(reader.line_num + 1, f'CSV 格式错误：{e}')])
+
+
+def _read_json(file):
+    text = file.read()
+    if text.lstrip().startswith('['):
+        try:
+            return list(enumerate(json.loads(text), 1))
+        except json.JSONDecodeError as e:
+            raise ImportFailed([(e.lineno, f'JSON 格式错误：{e.msg}')])
+    rows, errors = [], []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            rows.append((number, json.loads(line)))
+        except json.JSONDecodeError as e:
+            errors.append((number, f'JSON 格式错误：{e.msg}'))
+    if errors:
+        raise ImportFailed(errors)
+    return rows
+
+
+def _batches(items):
+    items = list(items)
+    for i in range(0, len(items), BATCH_SIZE):
+        yield items[i:i + BATCH_SIZE]
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _names(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    return {str(name).strip() for name in value if str(name).strip()}
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError(f'无效的布尔值：{value}')
+
+
+def _hash(raw_password, encoded):
+    """
+    encoded 与 raw_password 一致时返回 None，否则返回新的哈希
+    """
+    if encoded is not None and hashers.check_password(raw_password, encoded):
+        return None
+    return hashers.make_password(raw_password)
+
+
+class UserImport:
+
+    def __init__(self, rows, update_passwords=False, workers=None):
+        self.rows = rows
+        self.update_passwords = update_passwords
+        self.workers = workers or os.cpu_count() or 1
+
+    def load(self):
+        self.departments = dict(Department.objects.values_list('code', 'pk'))
+        self.rooms = {code: (pk, department_id)
+                      for code, pk, department_id in Room.objects.values_list('code', 'pk', 'department_id')}
+        self.groups = dict(Group.objects.values_list('name', 'pk'))
+        self.permissions = get_permission_catalog().index
+        usernames = [row.get('username') for _, row in self.rows if isinstance(row, dict)]
+        self.existing = {}
+        for batch in _batches(name.strip() for name in usernames if isinstance(name, str)):
+            self.existing.update((user.username, user) for user in UserModel.objects.filter(username__in=batch))
+
+    def parse(self, row):
+        """
+        返回 (用户名, 字段, 团队, 权限, 密码)，未提供的团队、权限、密码为 None
+        """
+        if not isinstance(row, dict):
+            raise ValidationError('每行必须是一个对象')
+        username = row.get('username')
+        if _is_empty(username):
+            raise ValidationError('缺少 username')
+        username = UserModel._meta.get_field('username').clean(str(username).strip(), None)
+
+        values = {}
+        for name in FIELDS:
+            if not _is_empty(row.get(name)):
+                values[name] = UserModel._meta.get_field(name).clean(str(row[name]).strip(), None)
+        for name in BOOLEAN_FIELDS:
+            if not _is_empty(row.get(name)):
+                values[name] = _boolean(row[name])
+
+        if not _is_empty(row.get('room')):
+            room = self.rooms.get(str(row['room']).strip().lower())
+            if room is None:
+                raise ValidationError(f'科室不存在：{row["room"]}')
+            if not _is_empty(row.get('department')):
+                department = str(row['department']).strip().lower()
+                if self.departments.get(department) != room[1]:
+                    raise ValidationError(f'科室 {row["room"]} 不属于部门 {row["department"]}')
+            values['room_id'] = room[0]
+        elif not _is_empty(row.get('department')):
+            raise ValidationError('指定部门时必须指定科室')
+
+        groups = permissions = None
+        if row.get('groups') is not None and (row['groups'] == [] or not _is_empty(row['groups'])):
+            names = _names(row['groups'])
+            unknown = names - self.groups.keys()
+            if unknown:
+                raise ValidationError(f'团队不存在：{", ".join(sorted(unknown))}')
+            groups = {self.groups[name] for name in names}
+        if row.get('permissions') is not None and (row['permissions'] == [] or not _is_empty(row['permissions'])):
+            names = _names(row['permissions'])
+            unknown = names - self.permissions.keys()
+            if unknown:
+                raise ValidationError(f'权限不存在：{", ".join(sorted(unknown))}')
+            permissions = {self.permissions[name] for name in names}
+
+        password = None if _is_empty(row.get('password')) else str(row['password'])
+        return username, values, groups, permissions, password
+
+    def plan(self):
+        """
+        校验全部的行，计算需要创建、更新的用户和中间表的差异，不写入数据库
+        """
+        self.load()
+        errors, seen = [], set()
+        # 已有用户中需要更新的 {pk: user}
+        self.creates, self.updates, self.changed_fields = [], {}, set()
+        # {username: (团队, 权限)}
+        self.relations = {}
+        passwords = []
+
+        for number, row in self.rows:
+            try:
+                username, values, groups, permissions, password = self.parse(row)
+            except ValidationError as e:
+                errors.append((number, '；'.join(e.messages)))
+                continue
+            if username in seen:
+                errors.append((number, f'用户名重复：{username}'))
+                continue
+            seen.add(username)
+
+            user = self.existing.get(username)
+            if user is None:
+                user = UserModel(username=username, **values)
+                if password is None:
+                    # 与 set_unusable_password 相同，get_random_string 逐个字符取随机数，批量时太慢
+                    user.password = hashers.UNUSABLE_PASSWORD_PREFIX + secrets.token_hex(20)
+                else:
+                    passwords.append((user, password, None))
+                self.creates.append(user)
+            else:
+                changed = {name for name, value in values.items() if getattr(user, name) != value}
+                for name in changed:
+                    setattr(user, name, values[name])
+                if password is not None and self.update_passwords:
+                    passwords.append((user, password, user.password))
+                if changed:
+                    self.updates[user.pk] = user
+                    self.changed_fields |= changed
+            self.relations[username] = (groups, permissions)
+
+        if errors:
+            raise ImportFailed(errors)
+        self.passwords = passwords
+        self.plan_relations()
+
+    def plan_relations(self):
+        """
+        已有用户中间表的差异：(多余行的 pk, 缺少的 (user_id, 目标 id))
+        新用户在写入后才有 pk，全部是缺少的行
+        """
+        self.relation_changes = {}
+        for index, through, column in ((0, UserModel.groups.through, 'group_id'),
+                                       (1, UserModel.user_permissions.through, 'permission_id')):
+            desired = {self.existing[name].pk: relations[index]
+                       for name, relations in self.relations.items()
+                       if relations[index] is not None and name in self.existing}
+            current = defaultdict(dict)
+            for batch in _batches(desired):
+                for pk, user_id, target_id in through.objects.filter(user_id__in=batch).values_list(
+                        'pk', 'user_id', column):
+                    current[user_id][target_id] = pk
+            stale = [pk for user_id, targets in desired.items()
+                     for target_id, pk in current[user_id].items() if target_id not in targets]
+            missing = [(user_id, target_id) for user_id, targets in desired.items()
+                       for target_id in targets - current[user_id].keys()]
+            touched = {user_id for user_id, targets in desired.items() if targets != current[user_id].keys()}
+            self.relation_changes[index] = (through, column, stale, missing, touched)
+
+    def hash_passwords(self):
+        """
+        在线程池中计算密码哈希，已有用户的密码没有变化时不修改
+        """
+        if not self.passwords:
+            return
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='import-hash') as executor:
+            encoded = executor.map(_hash, [raw for _, raw, _ in self.passwords],
+                                   [current for _, _, current in self.passwords])
+            for (user, _, current), password in zip(self.passwords, encoded):
+                if password is None:
+                    continue
+                user.password = password
+                if current is not None:
+                    self.updates[user.pk] = user
+                    self.changed_fields.add('password')
+
+    def run(self, dry_run=False):
+        """
+        导入并返回 {'created': 创建数, 'updated': 更新数, 'unchanged': 未修改数}
+        dry_run 时只校验并计算数量，不计算密码哈希，修改的密码不计入更新数
+        """
+        self.plan()
+        if not dry_run:
+            self.hash_passwords()
+
+        relation_users = set().union(*(changes[4] for changes in self.relation_changes.values()))
+        updated = self.updates.keys() | relation_users
+        result = {
+            'created': len(self.creates),
+            'updated': len(updated),
+            'unchanged': len(self.relations) - len(self.creates) - len(updated),
+        }
+        if dry_run or not (self.creates or updated):
+            return result
+
+        with transaction.atomic():
+            created = self.write()
+            touched = list(created.values()) + list(updated)
+            permissions_changed(touched)
+            index_users(touched)
+            # 新用户不会有缓存，只清除已有用户的缓存
+            for user in self.existing.values():
+                if user.pk in updated:
+                    invalidate_cached_user(user)
+        return result
+
+    def write(self):
+        """
+        写入用户和中间表，返回新用户的 {username: pk}
+        """
+        UserModel.objects.bulk_create(self.creates, batch_size=BATCH_SIZE)
+        if self.updates:
+            UserModel.objects.bulk_update(list(self.updates.values()), sorted(self.changed_fields),
+                                          batch_size=BATCH_SIZE)
+
+        created = {}
+        for batch in _batches(user.username for user in self.creates):
+            created.update(UserModel.objects.filter(username__in=batch).values_list('username', 'pk'))
+
+        for index, (through, column, stale, missing, _) in self.relation_changes.items():
+            for batch in _batches(stale):
+                through.objects.filter(pk__in=batch).delete()
+            missing = missing + [
+                (created[name], target_id)
+                for name, relations in self.relations.items() if name in created and relations[index]
+                for target_id in relations[index]
+            ]
+            through.objects.bulk_create(
+                [through(user_id=user_id, **{column: target_id}) for user_id, target_id in missing],
+                batch_size=BATCH_SIZE)
+        return created
+
+
+def import_users(rows, dry_run=False, update_passwords=False, workers=None):
+    """
+    rows 是 read_rows 的结果，校验失败时抛出 ImportFailed
+    """
+    return UserImport(rows, update_passwords=update_passwords, workers=workers).run(dry_run=dry_run)
@@ -0,0 +1,329 @@
+"""
+性能测试，直接对当前数据库运行：
+
+    python manage.py benchmark permissions --users 100
+    python manage.py benchmark encoding
+    python manage.py benchmark auth
+    python manage.py benchmark login
+    python manage.py benchmark middleware
+    python manage.py benchmark search --population 100000
+    python manage.py benchmark import --population 10000
+"""
+
+import logging
+import os
+import pickle
+import statistics
+import sys
+import threading
+import time
+import timeit
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.views import APIView
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.utils import jwt_decode_cache, jwt_encode_handler, jwt_payload_handler
+
+from account.backends import MyBackend
+from account.catalog import get_permission_catalog
+from account.hashing import hashing_pool
+from account.importer import UserImport
+from account.middleware import BrowserSessionAuthentication
+from account.models import Room
+from account.search import index_users, search_users
+from account.throttling import memory_buckets
+
+
+UserModel = get_user_model()
+
+
+class Command(BaseCommand):
+    help = '权限、认证等热点路径的性能测试'
+
+    targets = ('permissions', 'encoding', 'auth', 'login', 'middleware', 'search', 'import')
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=self.targets)
+        parser.add_argument('--users', type=int, default=100, help='参与测试的用户数')
+        parser.add_argument('--population', type=int, default=100000, help='search、import 测试生成的用户数')
+
+    def handle(self, *args, **options):
+        users = list(UserModel.objects.filter(is_active=True)[:options['users']])
+        if not users:
+            self.stderr.write('没有可用的用户')
+            return
+        self.population = options['population']
+        getattr(self, 'bench_%s' % options['target'])(users)
+
+    def override(self, **kwargs):
+        return override_settings(ACCOUNT={**getattr(settings, 'ACCOUNT', {}), **kwargs})
+
+    def override_jwt(self, **kwargs):
+        return override_settings(JWT_AUTH={**getattr(settings, 'JWT_AUTH', {}), **kwargs})
+
+    def clear_perm_cache(self, user):
+        for name in [name for name in vars(user) if name.endswith('perm_cache')]:
+            delattr(user, name)
+
+    def report(self, name, queries, seconds, count):
+        self.stdout.write(
+            f'{name:<24}{queries / count:>10.2f} queries/user'
+            f'{seconds * 1000 / count:>10.3f} ms/user'
+        )
+
+    def resolve(self, name, users, **overrides):
+        backend = MyBackend()
+        with self.override(**overrides), CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            for user in users:
+                self.clear_perm_cache(user)
+                backend.get_all_permissions(user)
+            seconds = time.perf_counter() - start
+        self.report(name, len(ctx), seconds, len(users))
+
+    def bench_permissions(self, users):
+        # materialized 需要先执行 rebuild_effective_permissions
+        for mode in ('sources', 'union', 'materialized'):
+            self.resolve(mode, users, PERMISSION_RESOLUTION=mode, PERMISSION_CACHE=None)
+        # 第一轮写入缓存，第二轮全部命中
+        self.resolve('union+cache (cold)', users, PERMISSION_RESOLUTION='union')
+        self.resolve('union+cache (warm)', users, PERMISSION_RESOLUTION='union')
+
+    def bench_encoding(self, users):
+        """
+        比较权限名集合与位图两种表示的内存、缓存大小和检查速度
+        """
+        backend = MyBackend()
+        catalog = get_permission_catalog()
+        with self.override(PERMISSION_ENCODING='set', PERMISSION_CACHE=None):
+            sets = []
+            for user in users:
+                self.clear_perm_cache(user)
+                sets.append(backend.get_all_permissions(user))
+        masks = [catalog.decode(catalog.encode(perms)) for perms in sets]
+
+        def set_memory(perms):
+            return sys.getsizeof(perms) + sum(sys.getsizeof(perm) for perm in perms)
+
+        count = len(users)
+        probes = list(catalog.index)[:50] or ['account.view_user']
+        rows = (
+            ('set', sets, set_memory, lambda perms: pickle.dumps(perms)),
+            ('bitmask', masks, lambda perms: sys.getsizeof(perms.mask), lambda perms: pickle.dumps(perms.mask)),
+        )
+        self.stdout.write(f'{"":<12}{"bytes/user":>14}{"cached bytes":>14}{"ns/check":>12}')
+        for name, values, memory, dump in rows:
+            size = sum(memory(perms) for perms in values) / count
+            cached = sum(len(dump(perms)) for perms in values) / count
+            sample = values[0]
+            seconds = timeit.timeit(lambda: [probe in sample for probe in probes], number=1000)
+            self.stdout.write(f'{name:<12}{size:>14.0f}{cached:>14.0f}{seconds * 1e9 / 1000 / len(probes):>12.1f}')
+
+    def authenticate(self, name, requests, rounds=10, **overrides):
+        auth = JSONWebTokenAuthentication()
+        with self.override_jwt(**overrides), CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for request in requests:
+                    auth.authenticate(request)
+            seconds = time.perf_counter() - start
+        count = len(requests) * rounds
+        self.stdout.write(f'{name:<24}{len(ctx) / count:>10.2f} queries/req{seconds * 1e6 / count:>10.1f} us/req')
+
+    def bench_auth(self, users):
+        """
+        JSONWebTokenAuthentication 每个请求的开销
+        """
+        factory = RequestFactory()
+        requests = [
+            factory.get('/', HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(user))}')
+            for user in users
+        ]
+        jwt_decode_cache.clear()
+        self.authenticate('no cache', requests, JWT_DECODE_CACHE_SIZE=0, JWT_USER_CACHE=None)
+        self.authenticate('decode cache (cold)', requests, rounds=1, JWT_USER_CACHE=None)
+        self.authenticate('decode cache (warm)', requests, JWT_USER_CACHE=None)
+        self.authenticate('decode+user cache (warm)', requests, JWT_USER_CACHE='default')
+        self.stdout.write(f'decode cache: {jwt_decode_cache.as_dict()}')
+
+    def attack(self, username, stop, statuses, interval=0.01):
+        """
+        每 interval 秒用错误的密码尝试一次同一个用户名
+        攻击者与被测的请求在同一个进程中，不限速时测到的主要是 GIL 的争用
+        """
+        client = Client(HTTP_HOST='localhost')
+        try:
+            while not stop.is_set():
+                response = client.post('/jwt/auth/', {'username': username, 'password': 'wrong'},
+                                       REMOTE_ADDR='10.9.9.9')
+                statuses.append(response.status_code)
+                time.sleep(interval)
+        finally:
+            connection.close()
+
+    def bench_login(self, users, legitimate=20, attackers=4):
+        """
+        登录的负载测试：attackers 个线程暴力尝试一个用户名时，其他用户正常登录的延迟
+        测试用户在事务中创建，结束后回滚
+        """
+        password = 'benchmark-password'
+        rows = (
+            ('no attack', 0, []),
+            ('no throttle', attackers, []),
+            ('LoginThrottle', attackers, ['account.throttling.LoginThrottle']),
+        )
+        # 不输出每个被拒绝请求的日志
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        self.stdout.write(f'{"":<16}{"ok":>6}{"p50 ms":>10}{"p95 ms":>10}{"attempts":>10}{"429":>8}{"503":>8}{"hashed":>8}')
+        with transaction.atomic():
+            encoded = make_password(password)
+            accounts = [
+                UserModel.objects.create(username=f'benchmark-login-{i}', password=encoded)
+                for i in range(legitimate)
+            ]
+            for name, count, throttles in rows:
+                memory_buckets.clear()
+                hashing_pool.stats.reset()
+                client = Client(HTTP_HOST='localhost')
+                with self.override_jwt(JWT_AUTH_THROTTLE_CLASSES=throttles):
+                    stop, statuses = threading.Event(), []
+                    threads = [
+                        threading.Thread(target=self.attack, args=(users[0].username, stop, statuses))
+                        for _ in range(count)
+                    ]
+                    for thread in threads:
+                        thread.start()
+                    time.sleep(0.5)
+
+                    latencies, ok = [], 0
+                    for i, account in enumerate(accounts):
+                        start = time.perf_counter()
+                        response = client.post('/jwt/auth/', {'username': account.username, 'password': password},
+                                               REMOTE_ADDR=f'10.1.0.{i + 1}')
+                        latencies.append(time.perf_counter() - start)
+                        ok += response.status_code == 200
+
+                    stop.set()
+                    for thread in threads:
+                        thread.join()
+
+                p50 = statistics.median(latencies) * 1000
+                p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000
+                self.stdout.write(
+                    f'{name:<16}{ok:>6}{p50:>10.1f}{p95:>10.1f}{len(statuses):>10}'
+                    f'{statuses.count(429):>8}{statuses.count(503):>8}{hashing_pool.stats.completed:>8}'
+                )
+            transaction.set_rollback(True)
+
+    def bench_middleware(self, users, rounds=200):
+        """
+        带 JWT 和会话 cookie 的 /account/info/ 请求，比较 Django 默认的中间件与快速通道
+        """
+        default = [
+            {
+                'account.middleware.FastLaneSessionMiddleware': 'django.contrib.sessions.middleware.SessionMiddleware',
+                'account.middleware.FastLaneCsrfViewMiddleware': 'django.middleware.csrf.CsrfViewMiddleware',
+                'account.middleware.FastLaneMessageMiddleware': 'django.contrib.messages.middleware.MessageMiddleware',
+            }.get(name, name)
+            for name in settings.MIDDLEWARE
+        ]
+        rows = (
+            ('default', default, SessionAuthentication),
+            ('fast lane', settings.MIDDLEWARE, BrowserSessionAuthentication),
+        )
+        user = users[0]
+        token = jwt_encode_handler(jwt_payload_handler(user))
+        for name, middleware, session_auth in rows:
+            # authentication_classes 在导入时就从 DRF 的配置中读出，直接替换
+            authentication = [session_auth, JSONWebTokenAuthentication]
+            with override_settings(MIDDLEWARE=middleware), \
+                    mock.patch.object(APIView, 'authentication_classes', authentication):
+                client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'JWT {token}')
+                # 同时登录过 admin 的浏览器，请求带有会话 cookie
+                client.force_login(user)
+                client.get('/account/info/')
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    for _ in range(rounds):
+                        client.get('/account/info/')
+                    seconds = time.perf_counter() - start
+                client.logout()
+            self.stdout.write(f'{name:<24}{len(ctx) / rounds:>10.2f} queries/req{seconds * 1e6 / rounds:>10.1f} us/req')
+
+    def bench_search(self, users, rounds=200):
+        """
+        在事务中生成 population 个用户并建立索引，测试后回滚，比较 icontains 扫描与搜索词索引
+        """
+        surnames, given = '赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨', '伟芳娜敏静丽强磊军洋勇艳杰涛明超秀霞平刚'
+        queries = ['李', '强', '王伟', 'user0420', '4321', 'cim 陈']
+        with transaction.atomic():
+            start = time.perf_counter()
+            first = UserModel.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            UserModel.objects.bulk_create((
+                UserModel(
+                    username=f'user{i:06d}', password='!',
+                    realname=surnames[i % len(surnames)] + given[i * 7 % len(given)] + given[i * 13 % len(given)],
+                    mobile=f'138{i:08d}', email=f'user{i:06d}@cec.com',
+                ) for i in range(self.population)
+            ))
+            count = index_users(UserModel.objects.filter(pk__gt=first).values_list('pk', flat=True))
+            self.stdout.write(f'indexed {self.population} users, {count} tokens in {time.perf_counter() - start:.1f}s')
+
+            rows = (
+                ('icontains', lambda q: UserModel.objects.filter(realname__icontains=q) |
+                    UserModel.objects.filter(username__icontains=q)),
+                ('token index', lambda q: search_users(UserModel.objects.all(), q)),
+            )
+            for name, search in rows:
+                for query in queries:
+                    timings = []
+                    for _ in range(rounds // len(queries)):
+                        start = time.perf_counter()
+                        list(search(query).order_by('pk')[:20])
+                        timings.append(time.perf_counter() - start)
+                    self.stdout.write(f'{name:<16}{query:<12}{statistics.median(timings) * 1000:>10.2f} ms p50')
+            transaction.set_rollback(True)
+
+    def bench_import(self, users, hashed=50):
+        """
+        在事务中导入 population 行后回滚：创建、原样重复导入、修改后导入，
+        密码哈希按 hashed 个密码的耗时估算
+        """
+        rooms = list(Room.objects.values_list('code', flat=True)[:10]) or ['']
+        groups = list(Group.objects.values_list('name', flat=True)[:3])
+
+        def rows(realname):
+            return [(i, {
+                'username': f'import{i:06d}', 'realname': f'{realname}{i % 1000}',
+                'email': f'import{i:06d}@cec.com', 'room': rooms[i % len(rooms)],
+                'groups': groups[:i % (len(groups) + 1)],
+            }) for i in range(self.population)]
+
+        with transaction.atomic():
+            for name, data in (('create', rows('张')), ('unchanged', rows('张')), ('update', rows('李'))):
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    result = UserImport(data).run()
+                    seconds = time.perf_counter() - start
+                self.stdout.write(f'{name:<12}{self.population / seconds:>10.0f} rows/s{seconds:>8.2f} s'
+                                  f'{len(ctx):>8} queries  {result}')
+            transaction.set_rollback(True)
+
+        for workers in sorted({1, os.cpu_count() or 1, 4}):
+            data = [(i, {'username': f'hash{i}', 'password': 'cecpanda123'}) for i in range(hashed)]
+            job = UserImport(data, workers=workers)
+            job.plan()
+            start = time.perf_counter()
+            job.hash_passwords()
+            seconds = time.perf_counter() - start
+            self.stdout.write(f'hash x{workers:<8}{hashed / seconds:>10.1f} passwords/s'
+                              f'{self.population * seconds / hashed:>8.0f} s per {self.population} rows')
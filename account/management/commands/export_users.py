@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from account.export import FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = '流式导出全部用户（NDJSON 或 CSV）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson', dest='export_format')
+        parser.add_argument('--output', help='输出文件，默认输出到标准输出')
+
+    def handle(self, *args, **options):
+        if options['output']:
+            # csv 模块要求 newline=''，utf-8-sig 让 Excel 正确识别中文
+            encoding = 'utf-8-sig' if options['export_format'] == 'csv' else 'utf-8'
+            with open(options['output'], 'w', encoding=encoding, newline='') as output:
+                count = self.write(output, options['export_format'])
+            self.stderr.write(self.style.SUCCESS(f'导出完成：{count} 行'))
+        else:
+            self.write(self.stdout, options['export_format'])
+
+    def write(self, output, export_format):
+        count = 0
+        for count, line in enumerate(export_lines(export_format), 1):
+            output.write(line)
+        return count
@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.importer import FORMATS, ImportFailed, import_users, read_rows
+
+
+class Command(BaseCommand):
+    help = '从 CSV 或 JSON 批量导入用户，已有的用户按 username 更新'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=FORMATS, dest='import_format',
+                            help='文件格式，默认按扩展名判断（.json、.ndjson 为 json）')
+        parser.add_argument('--dry-run', action='store_true', help='只校验并统计，不写入')
+        parser.add_argument('--update-passwords', action='store_true', help='修改已有用户的密码')
+        parser.add_argument('--workers', type=int, help='计算密码哈希的线程数，默认为 CPU 数')
+
+    def handle(self, *args, **options):
+        import_format = options['import_format']
+        if import_format is None:
+            extension = os.path.splitext(options['file'])[1].lower()
+            import_format = 'json' if extension in ('.json', '.ndjson') else 'csv'
+
+        start = time.perf_counter()
+        try:
+            with open(options['file'], encoding='utf-8-sig', newline='') as f:
+                rows = read_rows(f, import_format)
+            result = import_users(rows, dry_run=options['dry_run'],
+                                  update_passwords=options['update_passwords'], workers=options['workers'])
+        except ImportFailed as e:
+            for number, message in e.errors:
+                self.stderr.write(f'第 {number} 行：{message}')
+            raise CommandError(f'导入失败：{len(e.errors)} 个错误，没有写入任何数据')
+        except ValueError as e:
+            raise CommandError(f'无法读取文件：{e}')
+
+        seconds = time.perf_counter() - start
+        prefix = '（试运行，没有写入）' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}创建 {result["created"]}，更新 {result["updated"]}，未修改 {result["unchanged"]}，'
+            f'用时 {seconds:.1f}s'))
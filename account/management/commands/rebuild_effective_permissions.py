@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from account.cache import bump_permission_version
+from account.effective import diff_effective_permissions, refresh_effective_permissions
+
+
+UserModel = get_user_model()
+
+
+class Command(BaseCommand):
+    help = '全量重建用户有效权限的物化表，或检查物化表与实际权限是否一致'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='只检查，不写入；有差异时返回非零状态')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            missing, stale = diff_effective_permissions(UserModel.objects.values_list('pk', flat=True))
+            if missing or stale:
+                raise CommandError(f'物化表与实际权限不一致：缺少 {len(missing)} 行，多余 {len(stale)} 行')
+            self.stdout.write(self.style.SUCCESS('物化表与实际权限一致'))
+            return
+
+        added, removed = refresh_effective_permissions()
+        bump_permission_version()
+        self.stdout.write(self.style.SUCCESS(f'重建完成：新增 {added} 行，删除 {removed} 行'))
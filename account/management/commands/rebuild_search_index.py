@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from account.search import lazy_pinyin, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = '全量重建用户搜索的词表'
+
+    def handle(self, *args, **options):
+        if lazy_pinyin is None:
+            self.stderr.write('没有安装 pypinyin，不生成拼音搜索词')
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'重建完成：{count} 个搜索词'))
@@ -0,0 +1,106 @@
+"""
+JWT 请求的快速通道
+
+FAST_LANE_PREFIXES 下带有 `Authorization: JWT ...` 的请求只用 JWT 认证：
+不读取会话（不查询 django_session 表），不处理 CSRF 和消息。
+在 MIDDLEWARE 中用下面三个类替换 Django 对应的中间件，
+并在 REST_FRAMEWORK 中用 account.middleware.BrowserSessionAuthentication 替换 SessionAuthentication。
+
+没有 JWT 的请求（浏览器、admin、可浏览的 API）不受影响。
+快速通道中的请求没有会话，SessionAuthentication 不会认证它们，所以跳过 CSRF 检查是安全的。
+"""
+
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.backends.base import SessionBase
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from .settings import account_settings
+
+
+def in_fast_lane(request):
+    """
+    请求是否走快速通道，结果保存在 request.jwt_fast_lane 中
+    """
+    lane = getattr(request, 'jwt_fast_lane', None)
+    if lane is None:
+        prefix = api_settings.JWT_AUTH_HEADER_PREFIX + ' '
+        lane = (
+            request.META.get('HTTP_AUTHORIZATION', '').startswith(prefix)
+            and request.path_info.startswith(tuple(account_settings.FAST_LANE_PREFIXES))
+        )
+        request.jwt_fast_lane = lane
+    return lane
+
+
+class NoSession(SessionBase):
+    """
+    快速通道中的 request.session：始终为空，不读写任何存储
+    """
+
+    def load(self):
+        return {}
+
+    def exists(self, session_key):
+        return False
+
+    def create(self):
+        pass
+
+    def save(self, must_create=False):
+        pass
+
+    def delete(self, session_key=None):
+        pass
+
+
+class FastLaneSessionMiddleware(SessionMiddleware):
+
+    def process_request(self, request):
+        if in_fast_lane(request):
+            request.session = NoSession()
+        else:
+            super().process_request(request)
+
+    def process_response(self, request, response):
+        # 会话为空时 SessionMiddleware 会删除浏览器的会话 cookie，快速通道中不处理
+        if in_fast_lane(request):
+            return response
+        return super().process_response(request, response)
+
+
+class FastLaneCsrfViewMiddleware(CsrfViewMiddleware):
+
+    def process_request(self, request):
+        if not in_fast_lane(request):
+            super().process_request(request)
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if in_fast_lane(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+    def process_response(self, request, response):
+        if in_fast_lane(request):
+            return response
+        return super().process_response(request, response)
+
+
+class FastLaneMessageMiddleware(MessageMiddleware):
+
+    def process_request(self, request):
+        if not in_fast_lane(request):
+            super().process_request(request)
+
+
+class BrowserSessionAuthentication(SessionAuthentication):
+    """
+    只对浏览器、admin 等不带 JWT 的请求做会话认证
+    """
+
+    def authenticate(self, request):
+        if in_fast_lane(request._request):
+            return None
+        return super().authenticate(request)
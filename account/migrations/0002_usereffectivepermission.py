@@ -0,0 +1,29 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEffectivePermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth.Permission', verbose_name='permission')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_permissions', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': '有效权限',
+                'verbose_name_plural': '有效权限',
+                'unique_together': {('user', 'permission')},
+            },
+        ),
+    ]
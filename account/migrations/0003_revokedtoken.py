@@ -0,0 +1,30 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_usereffectivepermission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=64, unique=True, verbose_name='JWT ID')),
+                ('expires', models.DateTimeField(db_index=True, verbose_name='过期时间')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='吊销时间')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='revoked_tokens', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': '吊销的令牌',
+                'verbose_name_plural': '吊销的令牌',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:19
+
+from django.db import migrations, models
+import uuid
+
+
+def generate_secrets(apps, schema_editor):
+    # AddField 只计算一次默认值，已有的用户需要各自生成密钥
+    User = apps.get_model('account', 'User')
+    for pk in User.objects.values_list('pk', flat=True):
+        User.objects.filter(pk=pk).update(secret=uuid.uuid4())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='secret',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, verbose_name='令牌密钥'),
+        ),
+        migrations.RunPython(generate_secrets, migrations.RunPython.noop),
+    ]
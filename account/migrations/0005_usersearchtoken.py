@@ -0,0 +1,31 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_user_secret'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, verbose_name='词')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': '搜索词',
+                'verbose_name_plural': '搜索词',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='usersearchtoken',
+            index=models.Index(fields=['token', 'user'], name='account_use_token_cd3362_idx'),
+        ),
+    ]
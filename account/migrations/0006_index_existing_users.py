@@ -0,0 +1,34 @@
+from django.db import migrations
+
+from account.search import BATCH_SIZE, user_tokens
+
+
+def index_existing_users(apps, schema_editor):
+    # 0005 建立的词表是空的，admin 的搜索只查词表，已有的用户需要建立索引
+    User = apps.get_model('account', 'User')
+    UserSearchToken = apps.get_model('account', 'UserSearchToken')
+    rows = User.objects.order_by('pk').values_list(
+        'pk', 'username', 'realname', 'email', 'mobile',
+        'room__name', 'room__code', 'room__department__name', 'room__department__code')
+    tokens = []
+    for pk, *fields in rows.iterator():
+        tokens.extend(UserSearchToken(user_id=pk, token=token) for token in user_tokens(*fields))
+        if len(tokens) >= BATCH_SIZE:
+            UserSearchToken.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+            tokens = []
+    UserSearchToken.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+
+
+def clear_index(apps, schema_editor):
+    apps.get_model('account', 'UserSearchToken').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_usersearchtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_users, clear_index),
+    ]
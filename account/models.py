@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractUser, Group, Permission
@@ -68,6 +70,9 @@ class User(AbstractUser):
     # 用户只能加入一个科室，权限只看 Group，和 Department/Room/Team 无关
     room     = models.ForeignKey(Room, on_delete=models.PROTECT, blank=True, null=True, related_name='users', verbose_name='科室')
 
+    # JWT 的签名密钥，更换后该用户已签发的 token 全部失效，见 account.utils.jwt_get_user_secret_key
+    secret   = models.UUIDField('令牌密钥', default=uuid.uuid4, editable=False)
+
     class Meta:
         ordering = ('id',)
         verbose_name        = _('user')
@@ -76,6 +81,13 @@ class User(AbstractUser):
     def __str__(self):
         return f'{self.username}'
 
+    def rotate_secret(self):
+        '''
+        更换 JWT 签名密钥，在所有设备上退出登录
+        '''
+        self.secret = uuid.uuid4()
+        self.save(update_fields=['secret'])
+
 
 class GroupInfo(models.Model):
     group = models.OneToOneField(Group, on_delete=models.PROTECT, related_name='info', verbose_name='团队/组')
@@ -92,3 +104,57 @@ class GroupInfo(models.Model):
 
     def __str__(self):
         return f'{self.group}'
+
+
+class UserEffectivePermission(models.Model):
+    '''
+    用户有效权限的物化表，合并了用户、团队、科室、部门四个来源
+    由 account.effective 随权限来源的变化增量维护
+    '''
+    user       = models.ForeignKey(User, on_delete=models.CASCADE, related_name='effective_permissions', verbose_name=_('user'))
+    permission = models.ForeignKey(Permission, on_delete=models.CASCADE, related_name='+', verbose_name=_('permission'))
+
+    class Meta:
+        unique_together = ('user', 'permission')
+        verbose_name = '有效权限'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f'{self.user}: {self.permission}'
+
+
+class RevokedToken(models.Model):
+    '''
+    吊销的 JWT，按 jti 记录
+    expires 即 token 的 exp，过期后 token 本身已失效，记录由 account.revocation 自动清理
+    '''
+    jti     = models.CharField('JWT ID', unique=True, max_length=64)
+    user    = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='revoked_tokens', verbose_name=_('user'))
+    expires = models.DateTimeField('过期时间', db_index=True)
+    created = models.DateTimeField('吊销时间', auto_now_add=True)
+
+    class Meta:
+        ordering = ('-id',)
+        verbose_name = '吊销的令牌'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f'{self.jti}'
+
+
+class UserSearchToken(models.Model):
+    '''
+    用户搜索的词表，由 account.search 随用户、科室、部门的变化维护
+    按 token 的前缀做范围查询，(token, user) 的索引可以直接得到 user_id
+    '''
+    user  = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens', verbose_name=_('user'))
+    token = models.CharField('词', max_length=64)
+
+    class Meta:
+        indexes = [models.Index(fields=['token', 'user'])]
+        verbose_name = '搜索词'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f'{self.user_id}: {self.token}'
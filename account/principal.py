@@ -0,0 +1,103 @@
+"""
+JWT 认证使用的轻量用户对象
+
+在 JWT_AUTH 中设置 'JWT_PRINCIPAL_CLASS': 'account.principal.Principal' 后，
+JSONWebTokenAuthentication 返回 Principal 而不是完整的 User：
+只查询、保存权限检查需要的几个字段，其他字段（realname、avatar、brief 等）
+在第一次访问时才加载完整的 User。
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import _user_get_all_permissions, _user_has_module_perms, _user_has_perm
+
+
+UserModel = get_user_model()
+
+
+class Principal:
+    # 查询、缓存的字段，顺序即 dump() 的顺序
+    fields = ('id', 'username', 'is_active', 'is_staff', 'is_superuser', 'room_id', 'department_id')
+
+    __slots__ = fields + (
+        '_user',
+        # MyBackend 缓存权限用的属性
+        '_perm_cache', '_user_perm_cache', '_group_perm_cache',
+        '_room_perm_cache', '_department_perm_cache',
+    )
+
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, *values):
+        for name, value in zip(self.fields, values):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_user', None)
+
+    @classmethod
+    def from_username(cls, username):
+        values = UserModel.objects.filter(**{UserModel.USERNAME_FIELD: username}).values_list(
+            'id', 'username', 'is_active', 'is_staff', 'is_superuser', 'room_id', 'room__department_id').get()
+        return cls(*values)
+
+    def dump(self):
+        return tuple(getattr(self, name) for name in self.fields)
+
+    @classmethod
+    def restore(cls, data):
+        return cls(*data)
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def user(self):
+        '''
+        完整的 User，第一次访问时查询
+        '''
+        if self._user is None:
+            object.__setattr__(self, '_user', UserModel.objects.get(pk=self.id))
+        return self._user
+
+    def __getattr__(self, name):
+        # 未赋值的 slot 也会走到这里
+        if name in Principal.__slots__:
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        if name in Principal.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.user, name, value)
+
+    def __eq__(self, other):
+        return isinstance(other, (Principal, UserModel)) and other.pk == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.username
+
+    def __repr__(self):
+        return f'<Principal: {self.username}>'
+
+    def get_username(self):
+        return self.username
+
+    def has_perm(self, perm, obj=None):
+        if self.is_active and self.is_superuser:
+            return True
+        return _user_has_perm(self, perm, obj)
+
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def has_module_perms(self, app_label):
+        if self.is_active and self.is_superuser:
+            return True
+        return _user_has_module_perms(self, app_label)
+
+    def get_all_permissions(self, obj=None):
+        return _user_get_all_permissions(self, obj)
@@ -0,0 +1,170 @@
+"""
+JWT 吊销列表
+
+吊销的 token 以 jti 记录在 RevokedToken 表中。每个进程在内存中维护一个吊销 jti 的布隆过滤器，
+认证时先查过滤器，只有可能命中时才查询数据库，所以绝大多数请求不会因为吊销检查访问数据库。
+
+过滤器每隔 REVOCATION_CHECK_INTERVAL 秒增量加载其他进程新吊销的记录，
+每隔 REVOCATION_REBUILD_INTERVAL 秒清理已过期的记录并重建（布隆过滤器不能删除元素）。
+
+增量加载按吊销时间而不是主键：并发写入时，主键较小的记录可能在主键较大的记录之后才提交，
+所以每次加载上次加载时间前 REVOCATION_RELOAD_MARGIN 秒以来的记录，已加载过的 jti 不重复计数。
+token 在 exp + JWT_LEEWAY 之前仍能通过校验，记录也保留到那时才清理。
+
+在 JWT_AUTH 中设置 'JWT_REVOCATION_HANDLER': 'account.revocation.is_token_revoked' 启用。
+"""
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_jwt.settings import api_settings
+
+from .models import RevokedToken
+from .settings import account_settings
+
+
+class BloomFilter:
+    """
+    容量为 capacity、误判率约为 error_rate 的布隆过滤器
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, key):
+        # 双重哈希：由一个 128 位摘要得到 hashes 个下标
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for index in self._indexes(key):
+            self.bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[index >> 3] >> (index & 7) & 1 for index in self._indexes(key))
+
+
+class RevocationList:
+    """
+    进程内的吊销 jti 过滤器
+    """
+
+    def __init__(self):
+        self.filter = None
+        self.loaded = None
+        self.checked = 0
+        self.rebuilt = 0
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        purge_expired_tokens()
+        # 在查询之前取时间，查询期间提交的记录由下次加载补上
+        loaded = timezone.now()
+        jtis = list(RevokedToken.objects.values_list('jti', flat=True))
+        bloom = BloomFilter(max(len(jtis) * 2, account_settings.REVOCATION_CAPACITY),
+                            account_settings.REVOCATION_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self.filter = bloom
+        self.loaded = loaded
+        self.rebuilt = self.checked = time.monotonic()
+
+    def refresh(self):
+        loaded = timezone.now()
+        since = self.loaded - timedelta(seconds=account_settings.REVOCATION_RELOAD_MARGIN)
+        for jti in RevokedToken.objects.filter(created__gte=since).values_list('jti', flat=True):
+            # 时间窗口重叠，同一个 jti 会被多次加载，只在第一次计入容量
+            if jti not in self.filter:
+                self.filter.add(jti)
+        self.loaded = loaded
+        self.checked = time.monotonic()
+        if self.filter.count > self.filter.capacity:
+            # 超出容量后误判率上升，按新的数量重建
+            self.rebuild()
+
+    def get(self):
+        now = time.monotonic()
+        if (self.filter is None
+                or now - self.rebuilt >= account_settings.REVOCATION_REBUILD_INTERVAL
+                or now - self.checked >= account_settings.REVOCATION_CHECK_INTERVAL):
+            with self.lock:
+                if self.filter is None or now - self.rebuilt >= account_settings.REVOCATION_REBUILD_INTERVAL:
+                    self.rebuild()
+                elif now - self.checked >= account_settings.REVOCATION_CHECK_INTERVAL:
+                    self.refresh()
+        return self.filter
+
+    def add(self, jti):
+        """
+        本进程吊销的 token 立即生效，不必等下次加载
+        """
+        if self.filter is not None:
+            self.filter.add(jti)
+
+    def clear(self):
+        self.filter = None
+        self.loaded = None
+
+    def __contains__(self, jti):
+        if jti not in self.get():
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+
+revocation_list = RevocationList()
+
+
+def _expires(payload):
+    value = datetime.fromtimestamp(payload['exp'], timezone.utc)
+    if not settings.USE_TZ:
+        value = timezone.make_naive(value)
+    return value
+
+
+def is_token_revoked(payload):
+    """
+    JWT_REVOCATION_HANDLER：payload 对应的 token 是否已被吊销
+    没有 jti 的 token（加入 jti 之前签发的）无法吊销
+    """
+    jti = payload.get('jti')
+    return jti is not None and jti in revocation_list
+
+
+def revoke_token(payload, user=None):
+    """
+    吊销 payload 对应的 token，直到它过期
+    """
+    jti = payload.get('jti')
+    if jti is None:
+        return False
+    RevokedToken.objects.get_or_create(jti=jti, defaults={
+        'user_id': user.pk if user is not None else None,
+        'expires': _expires(payload),
+    })
+    revocation_list.add(jti)
+    return True
+
+
+def _leeway():
+    leeway = api_settings.JWT_LEEWAY
+    return leeway if isinstance(leeway, timedelta) else timedelta(seconds=leeway)
+
+
+def purge_expired_tokens():
+    """
+    删除 exp + JWT_LEEWAY 已过的记录，返回删除的行数
+    """
+    deleted, _ = RevokedToken.objects.filter(expires__lt=timezone.now() - _leeway()).delete()
+    return deleted
@@ -0,0 +1,116 @@
+"""
+用户搜索
+
+每个用户的真名、用户名、邮箱、手机、科室、部门拆成若干个词，保存在 UserSearchToken 中。
+搜索时每个关键字是一次 token 的前缀范围查询（token >= q AND token < q + U+10FFFF），
+走 (token, user) 索引，与用户数基本无关。多个关键字（空格分隔）同时匹配。
+
+为了支持部分匹配，中文名、科室和部门保存所有后缀：张三丰 -> 张三丰、三丰、丰，
+搜索“三丰”就是后缀“三丰”的前缀匹配。
+安装了 pypinyin 时还保存拼音和首字母：zhangsanfeng、sanfeng、feng、zsf、sf、f。
+
+用户、科室、部门保存时由 signals 更新，全量重建见 manage.py rebuild_search_index。
+"""
+
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+
+from .models import UserSearchToken
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+
+UserModel = get_user_model()
+
+# 影响搜索词的 User 字段
+SEARCH_FIELDS = {'username', 'realname', 'email', 'mobile', 'room', 'room_id'}
+
+TOKEN_LENGTH = UserSearchToken._meta.get_field('token').max_length
+BATCH_SIZE = 500
+# 手机号保存的最短后缀
+MOBILE_SUFFIX_LENGTH = 4
+MAX_TERMS = 5
+
+WORD_RE = re.compile(r'[\W_]+')
+
+
+def _suffixes(text, min_length=1):
+    return {text[i:] for i in range(len(text) - min_length + 1)}
+
+
+def _words(text):
+    text = text.lower()
+    return {text} | {word for word in WORD_RE.split(text) if word}
+
+
+def _name_tokens(name):
+    name = WORD_RE.sub('', name.lower())
+    tokens = _suffixes(name)
+    if lazy_pinyin is not None:
+        syllables = [syllable for syllable in lazy_pinyin(name) if syllable]
+        tokens |= {''.join(syllables[i:]) for i in range(len(syllables))}
+        tokens |= _suffixes(''.join(syllable[0] for syllable in syllables))
+    return tokens
+
+
+def user_tokens(username, realname=None, email=None, mobile=None,
+                room=None, room_code=None, department=None, department_code=None):
+    tokens = _words(username)
+    for name in (realname, room, department):
+        if name:
+            tokens |= _name_tokens(name)
+    for value in (email, room_code, department_code):
+        if value:
+            tokens |= _words(value)
+    if mobile:
+        tokens |= _suffixes(re.sub(r'\D', '', mobile), MOBILE_SUFFIX_LENGTH)
+    return {token[:TOKEN_LENGTH] for token in tokens if token}
+
+
+def index_users(user_ids):
+    """
+    重新生成用户的搜索词，返回写入的行数
+    """
+    user_ids = list(user_ids)
+    count = 0
+    for i in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[i:i + BATCH_SIZE]
+        rows = UserModel.objects.filter(pk__in=batch).values_list(
+            'pk', 'username', 'realname', 'email', 'mobile',
+            'room__name', 'room__code', 'room__department__name', 'room__department__code')
+        tokens = [
+            UserSearchToken(user_id=pk, token=token)
+            for pk, *fields in rows
+            for token in user_tokens(*fields)
+        ]
+        with transaction.atomic():
+            UserSearchToken.objects.filter(user_id__in=batch).delete()
+            UserSearchToken.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+        count += len(tokens)
+    return count
+
+
+def rebuild_search_index():
+    UserSearchToken.objects.all().delete()
+    return index_users(UserModel.objects.values_list('pk', flat=True).order_by('pk'))
+
+
+def search_users(queryset, query):
+    """
+    按关键字过滤用户，每个关键字都要匹配
+    纯数字的关键字同时按 id 精确匹配（admin 的 search_fields 中有 id）
+    """
+    for term in query.lower().split()[:MAX_TERMS]:
+        term = term[:TOKEN_LENGTH]
+        matches = UserSearchToken.objects.filter(token__gte=term, token__lt=term + '\U0010ffff')
+        condition = Q(pk__in=matches.values('user_id'))
+        if term.isdecimal() and len(term) < 19:
+            condition |= Q(pk=int(term))
+        queryset = queryset.filter(condition)
+    return queryset
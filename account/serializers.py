@@ -1,9 +1,28 @@
 from django.contrib.auth.models import Group, Permission
 from django.contrib.auth import get_user_model
-from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
 
+from .cache import cached_menu
+from .catalog import get_content_type_catalog
 from .models import Department, Room
+from .settings import account_settings
+
+
+class EagerLoadingMixin:
+    '''
+    序列化器需要的关联数据一次查出，避免列表中每个对象各查一次（N+1）
+    视图通过 setup_eager_loading 取得 queryset，见 account.views.EagerLoadingViewMixin
+    '''
+    select_related = ()
+    prefetch_related = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if cls.prefetch_related:
+            queryset = queryset.prefetch_related(*cls.prefetch_related)
+        return queryset
 
 
 UserModel = get_user_model()
@@ -16,8 +35,9 @@ class RoomForDepartmentSerializer(serializers.ModelSerializer):
         model = Room
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     rooms = RoomForDepartmentSerializer(many=True)
+    prefetch_related = ('rooms',)
 
     class Meta:
         fields = ('id', 'name', 'rooms')
@@ -31,18 +51,21 @@ class GroupForOthersSerializer(serializers.ModelSerializer):
         model = Group
 
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     groups = GroupForOthersSerializer(many=True)
+    prefetch_related = ('groups',)
 
     class Meta:
         fields = ('id', 'name', 'groups')
         model = Room
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     department = serializers.SerializerMethodField()
     room = serializers.SerializerMethodField()
     groups = serializers.SerializerMethodField()
+    select_related = ('room__department',)
+    prefetch_related = ('groups',)
 
     class Meta:
         fields = ('id', 'username', 'realname', 'email', 'mobile', 'avatar',
@@ -94,6 +117,10 @@ class UserInfoSerializer(serializers.ModelSerializer):
         model = UserModel
 
     def get_menu(self, obj):
+        # 按 (用户, 权限版本, 内容类型目录版本, 语言) 缓存，命中时不再扫描内容类型
+        return cached_menu(obj, self.build_menu, get_content_type_catalog().version)
+
+    def build_menu(self, obj):
         '''
         前端根据这个列表动态渲染导航
         menu = [
@@ -126,7 +153,7 @@ class UserInfoSerializer(serializers.ModelSerializer):
 
         # 三级导航通过权限的 view 判定
         # 找到所有服务，看是否有 view 权限
-        for service in ContentType.objects.all():
+        for service in get_content_type_catalog().content_types:
             p = f'{service.app_label}.view_{service.name}'
             if obj.has_perm(p):
                 menu.append(service.name)
@@ -142,11 +169,21 @@ class PermissionSerializer(serializers.Serializer):
     def validate(self, attrs):
         app = attrs.get('app')
         service = attrs.get('service')
-        if not ContentType.objects.filter(app_label=app, model=service).exists():
+        if (app, service) not in get_content_type_catalog():
             raise serializers.ValidationError(f'不存在您指定的app: {app}，或不存在service: {service}.')
         return attrs
 
 
+class BatchPermissionSerializer(serializers.Serializer):
+    permissions = PermissionSerializer(label='权限', many=True, allow_empty=False)
+
+    def validate_permissions(self, value):
+        limit = account_settings.PERMISSION_BATCH_SIZE
+        if len(value) > limit:
+            raise serializers.ValidationError(f'一次最多查询 {limit} 个权限.')
+        return value
+
+
 class PermissionsSerializer(serializers.ModelSerializer):
     department = serializers.SerializerMethodField()
     room = serializers.SerializerMethodField()
@@ -171,42 +208,10 @@ class PermissionsSerializer(serializers.ModelSerializer):
         return name
 
     def get_permissions(self, obj):
-        permissions = self.init_permissions()
-
-        for app_label, models in permissions.items():
-            for model in models.keys():
-                if obj.has_perm(f'{app_label}.view_{model}'):
-                    permissions[app_label][model]['view'] = True
-
-                if obj.has_perm(f'{app_label}.add_{model}'):
-                    permissions[app_label][model]['add'] = True
-
-                if obj.has_perm(f'{app_label}.change_{model}'):
-                    permissions[app_label][model]['change'] = True
-                    permissions[app_label][model]['view'] = True
-
-                if obj.has_perm(f'{app_label}.delete_{model}'):
-                    permissions[app_label][model]['delete'] = True
-        return permissions
+        # 由用户的权限集合和内容类型目录一次生成，不再逐个调用 has_perm
+        superuser = obj.is_active and obj.is_superuser
+        perms = set() if superuser else obj.get_all_permissions()
+        return get_content_type_catalog().permission_matrix(perms, superuser=superuser)
 
     def init_permissions(self):
-        permissions = dict()
-        app_labels = set()
-
-        for ct in ContentType.objects.all():
-            app_labels.add(ct.app_label)
-
-        try:
-            app_labels.remove('sessions')
-            app_labels.remove('contenttypes')
-            app_labels.remove('auth')
-            app_labels.remove('admin')
-        except KeyError:
-            pass
-
-        for app_label in app_labels:
-            permissions[app_label] = dict()
-            for ct in ContentType.objects.filter(app_label=app_label):
-                permissions[app_label][ct.model] = {"view": False, "add": False, "change": False, "delete": False}
-
-        return permissions
+        return get_content_type_catalog().permission_matrix(set())
@@ -0,0 +1,91 @@
+"""
+account 应用的配置，写在 settings.ACCOUNT 中，例如：
+
+ACCOUNT = {
+    'PERMISSION_RESOLUTION': 'union',
+}
+"""
+
+from django.conf import settings
+from django.test.signals import setting_changed
+from rest_framework.settings import APISettings
+
+
+DEFAULTS = {
+    # 权限的解析方式：
+    #   sources  四个来源（用户/团队/科室/部门）各查一次
+    #   union    一条 UNION 查询取出全部权限
+    #   materialized  从物化表 UserEffectivePermission 中取，需先执行
+    #                 manage.py rebuild_effective_permissions
+    'PERMISSION_RESOLUTION': 'union',
+
+    # 跨请求的权限缓存，填写 CACHES 中的别名，None 表示不缓存
+    # 必须是所有进程共享的缓存（Redis、Memcached 等）：signals 只在处理修改的进程中提升版本号，
+    # 进程内的 LocMemCache 会让其他进程继续使用旧的权限，见 account.checks
+    'PERMISSION_CACHE': None,
+    'PERMISSION_CACHE_TIMEOUT': 60 * 60 * 24,
+
+    # 有效权限的表示方式：
+    #   set      权限名的集合
+    #   bitmask  以权限主键为下标的整数位图，见 account.catalog
+    'PERMISSION_ENCODING': 'bitmask',
+
+    # 权限目录、内容类型目录在进程内缓存，每隔多少秒检查一次其他进程是否更新过
+    'CATALOG_CHECK_INTERVAL': 10,
+
+    # /account/user/get-permissions/ 一次最多查询的权限数
+    'PERMISSION_BATCH_SIZE': 100,
+
+    # JWT 吊销列表，见 account.revocation
+    # 每隔多少秒从数据库增量加载新吊销的 token
+    'REVOCATION_CHECK_INTERVAL': 5,
+    # 增量加载时向前多加载的秒数，应大于写入吊销记录的事务的最长耗时
+    'REVOCATION_RELOAD_MARGIN': 60,
+    # 每隔多少秒清理过期的记录并重建布隆过滤器
+    'REVOCATION_REBUILD_INTERVAL': 60 * 60,
+    # 布隆过滤器的初始容量和误判率
+    'REVOCATION_CAPACITY': 10000,
+    'REVOCATION_ERROR_RATE': 0.001,
+
+    # 登录时计算密码哈希的线程数，0 表示在请求的线程中计算，见 account.hashing
+    'LOGIN_HASH_WORKERS': 2,
+    # 最多排队的登录请求数，超出时返回 503
+    'LOGIN_HASH_QUEUE': 32,
+    # 503 响应的 Retry-After，单位秒
+    'LOGIN_HASH_RETRY_AFTER': 1,
+
+    # 登录限流的令牌桶，见 account.throttling，值为 None 的项不限流
+    # username 的桶按 (IP, 用户名) 计数，IP 取决于 REST_FRAMEWORK['NUM_PROXIES']
+    'LOGIN_THROTTLE_RATES': {
+        'username': '5/min',
+        'ip': '30/min',
+    },
+    # 保存令牌桶的缓存别名，None 表示保存在进程内
+    'LOGIN_THROTTLE_CACHE': None,
+
+    # 带 JWT 的请求不读取会话、不做 CSRF 检查的 URL 前缀，见 account.middleware
+    'FAST_LANE_PREFIXES': ('/account/', '/jwt/'),
+}
+
+# List of settings that may be in string import notation.
+IMPORT_STRINGS = ()
+
+
+class AccountSettings(APISettings):
+
+    @property
+    def user_settings(self):
+        if not hasattr(self, '_user_settings'):
+            self._user_settings = getattr(settings, 'ACCOUNT', {})
+        return self._user_settings
+
+
+account_settings = AccountSettings(None, DEFAULTS, IMPORT_STRINGS)
+
+
+def reload_account_settings(*args, **kwargs):
+    if kwargs['setting'] == 'ACCOUNT':
+        account_settings.reload()
+
+
+setting_changed.connect(reload_account_settings)
@@ -1,9 +1,21 @@
 import random
-from django.db.models.signals import post_save
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_save, pre_delete, post_delete, post_migrate, m2m_changed
 from django.dispatch import receiver
 
-from django.contrib.auth.models import Group
-from account.models import GroupInfo
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from account.cache import bump_permission_version
+from account.catalog import invalidate_permission_catalog, invalidate_content_type_catalog
+from account.effective import permissions_changed
+from account.models import GroupInfo, Department, Room, UserEffectivePermission
+from account.search import SEARCH_FIELDS, index_users
+from rest_framework_jwt.cache import invalidate_cached_user
+
+
+User = get_user_model()
 
 
 @receiver(post_save, sender=Group, dispatch_uid='add_group_info')
@@ -11,3 +23,160 @@ def group_info_handler(sender, **kwargs):
     if kwargs.get('created'):
         group = kwargs.get('instance')
         GroupInfo.objects.create(group=group, code=f'{random.randrange(100000, 999999)}')
+
+
+# 权限缓存失效、物化表维护
+# 每个多对多关系对应两个函数，分别由正向的 instance 和反向的 pk_set 找出受影响的用户
+PERMISSION_RELATIONS = {
+    Department.permissions.through: (
+        lambda department: User.objects.filter(room__department=department),
+        lambda pk_set: User.objects.filter(room__department__in=pk_set),
+    ),
+    Room.permissions.through: (
+        lambda room: User.objects.filter(room=room),
+        lambda pk_set: User.objects.filter(room__in=pk_set),
+    ),
+    Room.groups.through: (
+        lambda room: User.objects.filter(room=room),
+        lambda pk_set: User.objects.filter(room__in=pk_set),
+    ),
+    Group.permissions.through: (
+        lambda group: User.objects.filter(groups=group),
+        lambda pk_set: User.objects.filter(groups__in=pk_set),
+    ),
+    User.groups.through: (
+        lambda user: [user.pk],
+        lambda pk_set: pk_set,
+    ),
+    User.user_permissions.through: (
+        lambda user: [user.pk],
+        lambda pk_set: pk_set,
+    ),
+}
+
+# 用户的这些字段变化时权限会变
+USER_PERMISSION_FIELDS = {'room', 'room_id', 'is_active', 'is_superuser'}
+
+
+def permission_relation_handler(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    forward, backward = PERMISSION_RELATIONS[sender]
+    if not reverse:
+        users = forward(instance)
+    elif pk_set is not None:
+        users = backward(pk_set)
+    else:
+        # 反向 clear 时不知道清掉了哪些关系
+        permissions_changed()
+        return
+
+    if hasattr(users, 'values_list'):
+        users = users.values_list('pk', flat=True).distinct()
+    permissions_changed(users)
+
+
+# 只监听这几个中间表：不指定 sender 时所有模型都有 m2m_changed 的监听，
+# QuerySet.delete() 不能直接执行 DELETE，要先查出每一行再逐批删除
+for through in PERMISSION_RELATIONS:
+    m2m_changed.connect(permission_relation_handler, sender=through,
+                        dispatch_uid=f'bump_permission_version_on_m2m:{through._meta.label_lower}')
+
+
+@receiver(post_save, sender=User, dispatch_uid='bump_permission_version_on_user_save')
+def user_permission_handler(sender, instance, created, update_fields, **kwargs):
+    # 登录时只更新 last_login，不影响权限
+    if created or update_fields is None or USER_PERMISSION_FIELDS & set(update_fields):
+        permissions_changed([instance.pk])
+
+
+@receiver(post_delete, sender=User, dispatch_uid='bump_permission_version_on_user_delete')
+def user_delete_handler(sender, instance, **kwargs):
+    bump_permission_version([instance.pk])
+
+
+@receiver(post_save, sender=Room, dispatch_uid='bump_permission_version_on_room_save')
+def room_permission_handler(sender, instance, created, **kwargs):
+    # 科室换了部门，科室成员的部门权限随之变化
+    if not created:
+        permissions_changed(User.objects.filter(room=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Department, dispatch_uid='bump_permission_version_on_department_save')
+def department_handler(sender, instance, created, **kwargs):
+    # 导航菜单中有部门代码，部门改名或改代码后菜单要重新生成
+    if not created:
+        bump_permission_version(User.objects.filter(room__department=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Group, dispatch_uid='collect_users_on_group_delete')
+def group_pre_delete_handler(sender, instance, **kwargs):
+    # 删除后关系表中的行也没了，先记下受影响的用户
+    instance._affected_users = list(User.objects.filter(groups=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Group, dispatch_uid='bump_permission_version_on_group_delete')
+def group_delete_handler(sender, instance, **kwargs):
+    permissions_changed(getattr(instance, '_affected_users', None))
+
+
+@receiver(post_save, sender=Permission, dispatch_uid='bump_permission_version_on_permission_save')
+def permission_created_handler(sender, **kwargs):
+    invalidate_permission_catalog()
+    # 新增的权限只影响超级用户
+    permissions_changed(User.objects.filter(is_superuser=True).values_list('pk', flat=True))
+
+
+@receiver(post_migrate, sender=apps.get_app_config('account'), dispatch_uid='bump_permission_version_on_migrate')
+def permission_migrate_handler(sender, plan=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    invalidate_permission_catalog()
+    bump_permission_version()
+    # 回退迁移（如 migrate account zero）后用户表可能已不存在
+    if plan and all(backwards for _, backwards in plan):
+        return
+    tables = {User._meta.db_table, UserEffectivePermission._meta.db_table}
+    if not tables <= set(connections[using].introspection.table_names()):
+        return
+    # 新增的权限只影响超级用户，account 排在 INSTALLED_APPS 最后，此时各应用的权限都已建好
+    permissions_changed(User.objects.db_manager(using).filter(is_superuser=True).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Permission, dispatch_uid='bump_permission_version_on_permission_delete')
+def permission_delete_handler(sender, **kwargs):
+    # 物化表中的行已随权限级联删除
+    invalidate_permission_catalog()
+    bump_permission_version()
+
+
+@receiver(post_save, sender=ContentType, dispatch_uid='invalidate_content_type_catalog_on_save')
+@receiver(post_delete, sender=ContentType, dispatch_uid='invalidate_content_type_catalog_on_delete')
+@receiver(post_migrate, sender=apps.get_app_config('account'), dispatch_uid='invalidate_content_type_catalog_on_migrate')
+def content_type_handler(sender, **kwargs):
+    invalidate_content_type_catalog()
+
+
+@receiver(post_save, sender=User, dispatch_uid='invalidate_jwt_user_on_save')
+@receiver(post_delete, sender=User, dispatch_uid='invalidate_jwt_user_on_delete')
+def jwt_user_handler(sender, instance, **kwargs):
+    # JWT 认证时缓存的用户
+    invalidate_cached_user(instance)
+
+
+@receiver(post_save, sender=User, dispatch_uid='index_user_on_save')
+def user_search_handler(sender, instance, created, update_fields, **kwargs):
+    # 搜索词
+    if created or update_fields is None or SEARCH_FIELDS & set(update_fields):
+        index_users([instance.pk])
+
+
+@receiver(post_save, sender=Room, dispatch_uid='index_users_on_room_save')
+def room_search_handler(sender, instance, created, **kwargs):
+    if not created:
+        index_users(User.objects.filter(room=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Department, dispatch_uid='index_users_on_department_save')
+def department_search_handler(sender, instance, created, **kwargs):
+    if not created:
+        index_users(User.objects.filter(room__department=instance).values_list('pk', flat=True))
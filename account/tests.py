@@ -1,14 +1,51 @@
+import io
+import os
+import base64
+import threading
 import json
+import jwt
+import time
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+from importlib import import_module
 from pprint import pprint
 
-from django.contrib.auth import get_user_model
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
 from django.contrib.auth.models import Group, Permission
-from django.test import TestCase, RequestFactory, Client
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from django.core.management import call_command, CommandError
+from django.test import TestCase, TransactionTestCase, RequestFactory, Client, override_settings
 from rest_framework.test import APITestCase, APIRequestFactory, APIClient, RequestsClient
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_jwt import utils as jwt_utils
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.cache import secret_store
 
+from .backends import MyBackend
+from .cache import menu_stats
+from .checks import check_shared_caches
+from .export import export_rows
+from .hashing import LoginBusy, hashing_pool
+from .importer import ImportFailed, import_users, read_rows
+from .principal import Principal
+from .throttling import memory_buckets
+from .search import search_users
+from .revocation import BloomFilter, purge_expired_tokens, revocation_list, revoke_token
+from .catalog import GENERATION_KEY, invalidate_permission_catalog, ContentTypeCatalog, LazyCatalog, PermissionSet, get_permission_catalog, get_content_type_catalog
 from .views import UserViewSet
-from .models import Department, Room
-from .utils import fake
+from .models import Department, Room, RevokedToken, UserEffectivePermission, UserSearchToken
+from .utils import decode_permission_claim, fake
 
 
 UserModel = get_user_model()
@@ -44,6 +81,236 @@ class BackendTestCase(TestCase):
         user = UserModel.objects.get(username='durant')
         p = user.get_all_permissions()
 
+    @override_settings(ACCOUNT={'PERMISSION_CACHE': None})
+    def test_union_resolution(self):
+        user = UserModel.objects.get(username='durant')
+        with self.assertNumQueries(1):
+            perms = MyBackend().get_all_permissions(user)
+        self.assertEqual(perms, {'account.add_department', 'account.change_department', 'account.change_room'})
+
+        with override_settings(ACCOUNT={'PERMISSION_RESOLUTION': 'sources', 'PERMISSION_CACHE': None}):
+            user = UserModel.objects.get(username='durant')
+            with self.assertNumQueries(4):
+                self.assertEqual(MyBackend().get_all_permissions(user), perms)
+
+    @override_settings(ACCOUNT={'PERMISSION_CACHE': None})
+    def test_superuser_short_circuit(self):
+        user = UserModel.objects.get(username='durant')
+        user.is_superuser = True
+        with self.assertNumQueries(0):
+            self.assertTrue(MyBackend().has_perm(user, 'account.delete_user'))
+        get_permission_catalog()
+        with self.assertNumQueries(0):
+            self.assertIn('account.delete_user', MyBackend().get_all_permissions(user))
+
+
+# 测试在同一进程中运行，LocMemCache 相当于共享的缓存
+@override_settings(ACCOUNT={**settings.ACCOUNT, 'PERMISSION_CACHE': 'default'})
+class PermissionCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name="信息工程部", code='it')
+        self.room = Room.objects.create(name='CIM', code='cim', department=self.department)
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=self.room)
+        self.group = Group.objects.create(name='MES')
+
+    def get_perms(self):
+        user = UserModel.objects.get(pk=self.user.pk)
+        return user.get_all_permissions()
+
+    def assertInvalidated(self, perm, change):
+        self.assertNotIn(perm, self.get_perms())
+        change()
+        self.assertIn(perm, self.get_perms())
+
+    def test_warm_request_makes_no_permission_query(self):
+        self.get_perms()
+        user = UserModel.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            user.has_perm('account.view_user')
+
+    def test_invalidated_by_department_permissions(self):
+        p = Permission.objects.get(codename='view_department')
+        self.assertInvalidated('account.view_department', lambda: self.department.permissions.add(p))
+
+    def test_invalidated_by_room_permissions(self):
+        p = Permission.objects.get(codename='view_room')
+        self.assertInvalidated('account.view_room', lambda: p.room_set.add(self.room))
+
+    def test_invalidated_by_group(self):
+        p = Permission.objects.get(codename='view_group')
+        self.group.permissions.add(p)
+        self.assertInvalidated('auth.view_group', lambda: self.user.groups.add(self.group))
+        self.group.permissions.clear()
+        self.assertNotIn('auth.view_group', self.get_perms())
+
+    def test_invalidated_by_user_permissions(self):
+        p = Permission.objects.get(codename='view_user')
+        self.assertInvalidated('account.view_user', lambda: self.user.user_permissions.add(p))
+
+    def test_invalidated_by_room_change(self):
+        other = Department.objects.create(name="制造部", code='mfg')
+        other.permissions.add(Permission.objects.get(codename='delete_user'))
+        room = Room.objects.create(name='TFT', code='tft', department=other)
+
+        def change():
+            self.user.room = room
+            self.user.save()
+
+        self.assertInvalidated('account.delete_user', change)
+
+
+@override_settings(ACCOUNT={'PERMISSION_RESOLUTION': 'materialized', 'PERMISSION_CACHE': None})
+class EffectivePermissionTestCase(TestCase):
+
+    def setUp(self):
+        self.department = Department.objects.create(name="信息工程部", code='it')
+        self.room = Room.objects.create(name='CIM', code='cim', department=self.department)
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=self.room)
+        self.group = Group.objects.create(name='MES')
+        self.user.groups.add(self.group)
+
+    def get_perms(self):
+        user = UserModel.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            return MyBackend().get_all_permissions(user)
+
+    def test_maintained_incrementally(self):
+        self.department.permissions.add(Permission.objects.get(codename='view_department'))
+        self.room.permissions.add(Permission.objects.get(codename='view_room'))
+        self.group.permissions.add(Permission.objects.get(codename='view_group'))
+        self.user.user_permissions.add(Permission.objects.get(codename='view_user'))
+        self.assertEqual(self.get_perms(), {'account.view_department', 'account.view_room',
+                                            'auth.view_group', 'account.view_user'})
+
+        self.group.user_set.remove(self.user)
+        self.room.permissions.clear()
+        self.assertEqual(self.get_perms(), {'account.view_department', 'account.view_user'})
+        call_command('rebuild_effective_permissions', check=True, stdout=open(os.devnull, 'w'))
+
+    def test_rebuild_fixes_drift(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='view_user'))
+        UserEffectivePermission.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_effective_permissions', check=True)
+        call_command('rebuild_effective_permissions', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.get_perms(), {'account.view_user'})
+
+
+@override_settings(ACCOUNT={**settings.ACCOUNT, 'PERMISSION_RESOLUTION': 'materialized'})
+class MigrateTestCase(TransactionTestCase):
+
+    def setUp(self):
+        # 其他测试回滚的事务中新建的权限可能还在进程内的目录中
+        invalidate_permission_catalog()
+
+    def test_migrate_zero_and_back(self):
+        UserModel.objects.create_superuser(username='durant', email='', password='cecpanda123')
+        call_command('migrate', 'account', 'zero', verbosity=0)
+        self.assertNotIn(UserModel._meta.db_table, connection.introspection.table_names())
+        call_command('migrate', verbosity=0)
+        user = UserModel.objects.create_superuser(username='durant', email='', password='cecpanda123')
+        self.assertEqual(UserEffectivePermission.objects.filter(user=user).count(), Permission.objects.count())
+
+
+class SharedCacheCheckTestCase(TestCase):
+
+    def test_local_cache_rejected(self):
+        self.assertEqual(check_shared_caches(None), [])
+        with override_settings(ACCOUNT={**settings.ACCOUNT, 'PERMISSION_CACHE': 'default'}):
+            self.assertEqual([error.id for error in check_shared_caches(None)], ['account.E001'])
+        with override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_USER_CACHE': 'default'}):
+            self.assertEqual([error.id for error in check_shared_caches(None)], ['account.E002'])
+        with override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_SIGNING_KEYS': [{'kid': 'k', 'algorithm': 'HS256'}],
+                                         'JWT_GET_USER_SECRET_KEY': 'account.utils.jwt_get_user_secret_key'}):
+            self.assertEqual([error.id for error in check_shared_caches(None)], ['account.E003'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                  'shared': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared, ACCOUNT={**settings.ACCOUNT, 'PERMISSION_CACHE': 'shared'}):
+            self.assertEqual(check_shared_caches(None), [])
+
+
+class PermissionCatalogTestCase(TestCase):
+
+    def test_bitmask_round_trip(self):
+        catalog = get_permission_catalog()
+        perms = {'account.view_user', 'auth.add_group'}
+        mask = catalog.encode(perms)
+        self.assertEqual(mask, 1 << catalog.index['account.view_user'] | 1 << catalog.index['auth.add_group'])
+
+        perm_set = catalog.decode(mask)
+        self.assertEqual(perm_set, perms)
+        self.assertIn('account.view_user', perm_set)
+        self.assertNotIn('account.delete_user', perm_set)
+        self.assertNotIn('menu.is_manager', perm_set)
+        self.assertEqual(PermissionSet.from_bytes(perm_set.to_bytes(), catalog), perms)
+
+    def test_indexes(self):
+        self.assertEqual(get_permission_catalog().by_codename('view_user'), ['account.view_user'])
+        self.assertEqual(get_content_type_catalog().get('account', 'user'), ContentType.objects.get_for_model(UserModel))
+
+    @override_settings(ACCOUNT={**settings.ACCOUNT, 'CATALOG_CHECK_INTERVAL': 0, 'PERMISSION_CACHE': 'default'})
+    def test_reloaded_when_other_worker_invalidates(self):
+        # 把 LocMemCache 当作共享的缓存
+        with mock.patch('account.catalog.is_local_cache', return_value=False):
+            catalog = get_content_type_catalog()
+            with self.assertNumQueries(0):
+                self.assertIs(get_content_type_catalog(), catalog)
+            # 模拟其他进程使目录失效
+            cache.set(GENERATION_KEY % 'contenttype', 'other-worker')
+            with self.assertNumQueries(1):
+                self.assertIsNot(get_content_type_catalog(), catalog)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'worker-a': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-a'},
+        'worker-b': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-b'},
+    })
+    def test_reloaded_without_shared_cache(self):
+        # 两个进程各自的目录和 LocMemCache
+        workers = {
+            name: (LazyCatalog('contenttype', ContentTypeCatalog.load, ContentType, ('pk', 'app_label', 'model')),
+                   override_settings(ACCOUNT={**settings.ACCOUNT, 'CATALOG_CHECK_INTERVAL': 0,
+                                              'PERMISSION_CACHE': name}))
+            for name in ('worker-a', 'worker-b')
+        }
+        for catalog, config in workers.values():
+            with config:
+                self.assertIsNone(catalog.get().get('eq', 'cvd'))
+
+        # 进程 a 中新增内容类型，signals 只使进程 a 的目录失效
+        catalog, config = workers['worker-a']
+        with config:
+            ContentType.objects.create(app_label='eq', model='cvd')
+            catalog.invalidate()
+            self.assertIsNotNone(catalog.get().get('eq', 'cvd'))
+        catalog, config = workers['worker-b']
+        with config:
+            self.assertIsNotNone(catalog.get().get('eq', 'cvd'))
+            # 没有变化时只有一条查询
+            with self.assertNumQueries(1):
+                catalog.get()
+
+        # 改名不改变行数和主键
+        catalog, config = workers['worker-a']
+        with config:
+            ContentType.objects.filter(app_label='eq', model='cvd').update(model='pvd')
+            catalog.invalidate()
+        catalog, config = workers['worker-b']
+        with config:
+            self.assertIsNone(catalog.get().get('eq', 'cvd'))
+            self.assertIsNotNone(catalog.get().get('eq', 'pvd'))
+
+    def test_backend_returns_bitmask(self):
+        d = Department.objects.create(name="信息工程部", code='it')
+        user = UserModel.objects.create_user(username='durant', room=Room.objects.create(name='CIM', code='cim', department=d))
+        d.permissions.add(Permission.objects.get(codename='view_room'))
+        user = UserModel.objects.get(pk=user.pk)
+        self.assertIsInstance(MyBackend().get_all_permissions(user), PermissionSet)
+        self.assertTrue(user.has_perm('account.view_room'))
+        self.assertEqual(user.get_all_permissions(), {'account.view_room'})
+
 
 class UserViewSetTestCase(TestCase):
 
@@ -101,6 +368,1049 @@ class UserViewSetAPITestCase(APITestCase):
         self.assertEqual(response.data.get('count'), 50)
 
 
+class BatchPermissionTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        d = Department.objects.create(name="信息工程部", code='it')
+        r = Room.objects.create(name='CIM', code='cim', department=d)
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=r)
+        r.permissions.add(Permission.objects.get(codename='view_room'))
+        self.client.force_authenticate(user=UserModel.objects.get(pk=self.user.pk))
+
+    def test_batch_permission(self):
+        data = {'permissions': [
+            {'app': 'account', 'action': 'view', 'service': 'room'},
+            {'app': 'account', 'action': 'delete', 'service': 'room'},
+            {'app': 'auth', 'action': 'view', 'service': 'group'},
+        ]}
+        get_content_type_catalog()
+        get_permission_catalog()
+        with self.assertNumQueries(1):
+            r = self.client.post('/account/user/get-permissions/', data, format='json')
+        self.assertEqual([item['allowed'] for item in r.data['results']], [True, False, False])
+
+    def test_batch_permission_validation(self):
+        data = {'permissions': [{'app': 'account', 'action': 'view', 'service': 'nothing'}]}
+        r = self.client.post('/account/user/get-permissions/', data, format='json')
+        self.assertEqual(r.status_code, 400)
+
+        with override_settings(ACCOUNT={'PERMISSION_BATCH_SIZE': 1}):
+            data = {'permissions': [{'app': 'account', 'action': 'view', 'service': 'room'}] * 2}
+            r = self.client.post('/account/user/get-permissions/', data, format='json')
+            self.assertEqual(r.status_code, 400)
+
+
+class PermissionMatrixTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        d = Department.objects.create(name="信息工程部", code='it')
+        r = Room.objects.create(name='CIM', code='cim', department=d)
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=r)
+        r.permissions.add(Permission.objects.get(codename='change_room'))
+        d.permissions.add(Permission.objects.get(codename='add_user'))
+
+    def get_matrix(self):
+        self.client.force_authenticate(user=UserModel.objects.get(pk=self.user.pk))
+        get_content_type_catalog()
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get('/account/permission/')
+        return r.data['permissions'], len(ctx)
+
+    def test_permission_matrix(self):
+        matrix, _ = self.get_matrix()
+        self.assertNotIn('auth', matrix)
+        self.assertEqual(matrix['account']['room'], {'view': True, 'add': False, 'change': True, 'delete': False})
+        self.assertEqual(matrix['account']['user'], {'view': False, 'add': True, 'change': False, 'delete': False})
+
+    @override_settings(ACCOUNT={'PERMISSION_CACHE': None})
+    def test_constant_queries(self):
+        _, queries = self.get_matrix()
+        for i in range(20):
+            ContentType.objects.create(app_label=f'service{i}', model='eq')
+        matrix, more_queries = self.get_matrix()
+        self.assertIn('service19', matrix)
+        self.assertEqual(queries, more_queries)
+
+
+@override_settings(ACCOUNT={**settings.ACCOUNT, 'PERMISSION_CACHE': 'default'})
+class MenuCacheTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        menu_stats.reset()
+        self.department = Department.objects.create(name="信息工程部", code='it')
+        self.room = Room.objects.create(name='CIM', code='cim', department=self.department)
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=self.room)
+        ContentType.objects.create(app_label='eq', model='cvd')
+        self.department.permissions.add(Permission.objects.create(
+            codename='view_cvd', name='view cvd', content_type=ContentType.objects.get(app_label='eq')))
+
+    def get_menu(self, user=None):
+        self.client.force_authenticate(user=user or UserModel.objects.get(pk=self.user.pk))
+        return self.client.get('/account/info/').data['menu']
+
+    def test_menu(self):
+        self.assertEqual(self.get_menu(), ['member', 'it', 'cim', 'cvd'])
+        get_content_type_catalog()
+        user = UserModel.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_menu(user), ['member', 'it', 'cim', 'cvd'])
+        self.assertEqual(menu_stats.as_dict()['hits'], 1)
+
+    def test_menu_invalidated(self):
+        self.get_menu()
+        self.department.code = 'mfg'
+        self.department.save()
+        self.assertEqual(self.get_menu(), ['member', 'mfg', 'cim', 'cvd'])
+        self.department.permissions.clear()
+        self.assertEqual(self.get_menu(), ['member', 'mfg', 'cim'])
+        self.assertEqual(menu_stats.as_dict()['misses'], 3)
+
+    def test_cache_stats(self):
+        r = self.client.get('/account/cache-stats/')
+        self.assertEqual(r.status_code, 403)
+        self.client.force_authenticate(user=UserModel.objects.create_superuser('admin', 'admin@cec.com', 'cecpanda123'))
+        r = self.client.get('/account/cache-stats/')
+        self.assertIn('menu', r.data)
+
+
+@override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_DECODE_CACHE_SIZE': 2})
+class JWTDecodeCacheTestCase(TestCase):
+
+    def setUp(self):
+        jwt_utils.jwt_decode_cache.clear()
+        self.users = [UserModel.objects.create_user(username=f'durant{i}', password='cecpanda123') for i in range(3)]
+        self.tokens = [jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(user)) for user in self.users]
+
+    def test_repeat_decode_skips_jwt(self):
+        with mock.patch('rest_framework_jwt.utils.jwt.decode', wraps=jwt_utils.jwt.decode) as decode:
+            payload = jwt_utils.jwt_decode_handler(self.tokens[0])
+            self.assertEqual(decode.call_count, 2)
+            self.assertEqual(jwt_utils.jwt_decode_handler(self.tokens[0].encode()), payload)
+            self.assertEqual(decode.call_count, 2)
+        self.assertEqual(jwt_utils.jwt_decode_cache.as_dict()['hits'], 1)
+
+    def test_bounded(self):
+        for token in self.tokens:
+            jwt_utils.jwt_decode_handler(token)
+        self.assertEqual(jwt_utils.jwt_decode_cache.as_dict()['size'], 2)
+        self.assertIsNone(jwt_utils.jwt_decode_cache.get(self.tokens[0]))
+
+    def test_expires_with_token(self):
+        payload = jwt_utils.jwt_payload_handler(self.users[0])
+        payload['exp'] = datetime.utcnow() + timedelta(seconds=1)
+        token = jwt_utils.jwt_encode_handler(payload)
+        jwt_utils.jwt_decode_handler(token)
+        self.assertIsNotNone(jwt_utils.jwt_decode_cache.get(token))
+        with mock.patch('rest_framework_jwt.utils.time.time', return_value=time.time() + 2):
+            self.assertIsNone(jwt_utils.jwt_decode_cache.get(token))
+
+    def test_invalid_token_not_cached(self):
+        with self.assertRaises(jwt_utils.jwt.DecodeError):
+            jwt_utils.jwt_decode_handler(self.tokens[0][:-2])
+        self.assertEqual(jwt_utils.jwt_decode_cache.as_dict()['size'], 0)
+
+
+@override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_USER_CACHE': 'default'})
+class JWTUserCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', brief='...')
+        token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        self.request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'JWT {token}')
+
+    def authenticate(self):
+        return JSONWebTokenAuthentication().authenticate(self.request)[0]
+
+    def test_warm_authentication_makes_no_query(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, 'durant', True))
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('cecpanda123'))
+
+    def test_invalidated_on_save(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_invalidated_on_rename(self):
+        self.authenticate()
+        self.user.username = 'kd'
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+@override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_PRINCIPAL_CLASS': 'account.principal.Principal'})
+class PrincipalTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        d = Department.objects.create(name="信息工程部", code='it')
+        self.room = Room.objects.create(name='CIM', code='cim', department=d)
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=self.room)
+        self.room.permissions.add(Permission.objects.get(codename='view_room'))
+        self.token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.token}')
+
+    def authenticate(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'JWT {self.token}')
+        return JSONWebTokenAuthentication().authenticate(request)[0]
+
+    def test_principal(self):
+        principal = self.authenticate()
+        self.assertIsInstance(principal, Principal)
+        self.assertEqual((principal.pk, principal.room_id, principal.department_id),
+                         (self.user.pk, self.room.pk, self.room.department_id))
+        self.assertTrue(principal.has_perm('account.view_room'))
+        self.assertFalse(principal.has_perm('account.delete_room'))
+        self.assertIsNone(principal._user)
+
+        self.assertEqual(principal.get_all_permissions(), {'account.view_room'})
+        self.assertEqual(principal.brief, None)
+        self.assertEqual(principal.user, self.user)
+
+    def test_views(self):
+        r = self.client.post('/account/user/get-permission/', {'app': 'account', 'action': 'view', 'service': 'room'})
+        self.assertTrue(r.data['allowed'])
+        r = self.client.post('/account/user/change-profile/', {'realname': 'KD', 'gender': 'M'})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(UserModel.objects.get(pk=self.user.pk).realname, 'KD')
+        r = self.client.get('/account/info/')
+        self.assertEqual(r.data['realname'], 'KD')
+
+
+def generate_pem(private_key):
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+
+
+class JWTBulkVerifyTestCase(APITestCase):
+
+    def setUp(self):
+        jwt_utils.jwt_decode_cache.clear()
+        revocation_list.clear()
+        revocation_list.get()
+        self.users = [UserModel.objects.create_user(username=f'durant{i}', password='cecpanda123') for i in range(3)]
+        self.tokens = [jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(user)) for user in self.users]
+
+    def test_bulk_verify(self):
+        self.users[1].is_active = False
+        self.users[1].save()
+        payload = jwt_utils.jwt_payload_handler(self.users[2])
+        payload['exp'] = datetime.utcnow() - timedelta(seconds=1)
+        expired = jwt_utils.jwt_encode_handler(payload)
+        self.users[2].delete()
+        tokens = self.tokens + [expired, 'abc']
+        with self.assertNumQueries(1):
+            response = self.client.post('/jwt/verify/bulk/', {'tokens': tokens}, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['valid'] for r in results], [True, False, False, False, False])
+        self.assertEqual(results[0]['username'], 'durant0')
+        self.assertEqual(results[0]['exp'], jwt_utils.jwt_decode_handler(self.tokens[0])['exp'])
+        self.assertEqual(results[1]['error'], gettext('User account is disabled.'))
+        self.assertEqual(results[2]['error'], gettext("User doesn't exist."))
+        self.assertEqual(results[3]['error'], gettext('Signature has expired.'))
+        self.assertEqual(results[4]['error'], gettext('Error decoding signature.'))
+
+    def test_bad_token_does_not_fail_batch(self):
+        payload = jwt_utils.jwt_payload_handler(self.users[0])
+        tokens = [
+            # 头部的算法与配置不同
+            jwt.encode(payload, settings.JWT_AUTH['JWT_SECRET_KEY'], 'HS512').decode('utf-8'),
+            jwt.encode(dict(payload, aud='mes'), settings.JWT_AUTH['JWT_SECRET_KEY'], 'HS256').decode('utf-8'),
+            self.tokens[1],
+        ]
+        response = self.client.post('/jwt/verify/bulk/', {'tokens': tokens}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['valid'] for r in response.data['results']], [False, False, True])
+
+    @override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_GET_USER_SECRET_KEY': 'account.utils.jwt_get_user_secret_key'})
+    def test_deleted_user_with_user_secret(self):
+        cache.clear()
+        secret_store.clear()
+        tokens = [jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(user)) for user in self.users[:2]]
+        self.users[0].delete()
+        response = self.client.post('/jwt/verify/bulk/', {'tokens': tokens}, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['valid'] for r in results], [False, True])
+        self.assertEqual(results[0]['error'], gettext("User doesn't exist."))
+
+    @override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_BULK_VERIFY_MAX_TOKENS': 2})
+    def test_limit(self):
+        response = self.client.post('/jwt/verify/bulk/', {'tokens': self.tokens}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/jwt/verify/bulk/', {'tokens': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_USER_CACHE': 'default',
+                            'JWT_GET_USER_SECRET_KEY': 'account.utils.jwt_get_user_secret_key'})
+class JWTUserSecretTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        jwt_utils.jwt_decode_cache.clear()
+        secret_store.clear()
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123')
+        self.token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+
+    def test_warm_decode_makes_no_query(self):
+        jwt_utils.jwt_decode_handler(self.token)
+        jwt_utils.jwt_decode_cache.clear()
+        secret_store.clear()
+        # 进程内缓存为空时从 Django 的缓存中取
+        with self.assertNumQueries(0):
+            self.assertEqual(jwt_utils.jwt_decode_handler(self.token)['username'], 'durant')
+            self.assertEqual(jwt_utils.jwt_decode_handler(self.token)['username'], 'durant')
+
+    def test_rotate_secret(self):
+        jwt_utils.jwt_decode_handler(self.token)
+        self.user.rotate_secret()
+        with self.assertRaises(jwt_utils.jwt.DecodeError):
+            jwt_utils.jwt_decode_handler(self.token)
+        token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        self.assertEqual(jwt_utils.jwt_decode_handler(token)['username'], 'durant')
+
+    def test_rotated_in_other_worker(self):
+        jwt_utils.jwt_decode_handler(self.token)
+        # 其他进程更换了密钥：共享缓存中的密钥已删除，本进程内的副本在 JWT_USER_SECRET_MEMORY_TTL 后过期
+        UserModel.objects.filter(pk=self.user.pk).update(secret=uuid.uuid4())
+        cache.clear()
+        with mock.patch('rest_framework_jwt.cache.time.monotonic', return_value=time.monotonic() + 6):
+            with self.assertRaises(jwt_utils.jwt.DecodeError):
+                jwt_utils.jwt_decode_handler(self.token)
+
+    def test_deleted_user(self):
+        jwt_utils.jwt_decode_cache.clear()
+        secret_store.clear()
+        self.user.delete()
+        response = APIClient().get('/account/info/', HTTP_AUTHORIZATION=f'JWT {self.token}')
+        self.assertEqual(response.status_code, 403)
+
+    def test_secrets_differ(self):
+        other = UserModel.objects.create_user(username='curry', password='cecpanda123')
+        self.assertNotEqual(jwt_utils.jwt_get_secret_key({'user_id': self.user.pk}),
+                            jwt_utils.jwt_get_secret_key({'user_id': other.pk}))
+
+
+class JWTKeyRingTestCase(APITestCase):
+
+    def setUp(self):
+        jwt_utils.jwt_decode_cache.clear()
+        self.rsa_key = generate_pem(rsa.generate_private_key(65537, 2048, default_backend()))
+        self.ec_key = generate_pem(ec.generate_private_key(ec.SECP256R1(), default_backend()))
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123')
+
+    def signing_keys(self, *keys):
+        return override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_SIGNING_KEYS': list(keys)})
+
+    def test_round_trip(self):
+        for kid, algorithm, key in (('rsa', 'RS256', self.rsa_key), ('ec', 'ES256', self.ec_key)):
+            with self.signing_keys({'kid': kid, 'algorithm': algorithm, 'private_key': key}):
+                token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+                self.assertEqual(jwt_utils.jwt.get_unverified_header(token), {'typ': 'JWT', 'alg': algorithm, 'kid': kid})
+                self.assertEqual(jwt_utils.jwt_decode_handler(token)['username'], 'durant')
+
+    def test_rotation(self):
+        old = {'kid': 'old', 'algorithm': 'RS256', 'private_key': self.rsa_key}
+        new = {'kid': 'new', 'algorithm': 'ES256', 'private_key': self.ec_key}
+        with self.signing_keys(old):
+            token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        with self.signing_keys(new, old):
+            self.assertEqual(jwt_utils.jwt_decode_handler(token)['username'], 'durant')
+            new_token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+            self.assertEqual(jwt_utils.jwt.get_unverified_header(new_token)['kid'], 'new')
+        jwt_utils.jwt_decode_cache.clear()
+        with self.signing_keys(new):
+            with self.assertRaises(jwt_utils.jwt.DecodeError):
+                jwt_utils.jwt_decode_handler(token)
+
+    def test_removed_key_not_served_from_cache(self):
+        old = {'kid': 'old', 'algorithm': 'RS256', 'private_key': self.rsa_key}
+        new = {'kid': 'new', 'algorithm': 'ES256', 'private_key': self.ec_key}
+        with self.signing_keys(old):
+            token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        with self.signing_keys(new, old):
+            jwt_utils.jwt_decode_handler(token)
+            self.assertEqual(jwt_utils.jwt_decode_handler(token)['username'], 'durant')
+            self.assertEqual(jwt_utils.jwt_decode_cache.as_dict()['hits'], 1)
+        with self.signing_keys(new):
+            with self.assertRaises(jwt_utils.jwt.DecodeError):
+                jwt_utils.jwt_decode_handler(token)
+
+    def test_legacy_tokens(self):
+        token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        with self.signing_keys({'kid': 'rsa', 'algorithm': 'RS256', 'private_key': self.rsa_key}):
+            self.assertEqual(jwt_utils.jwt_decode_handler(token)['username'], 'durant')
+
+    def test_jwks(self):
+        with self.signing_keys({'kid': 'rsa', 'algorithm': 'RS256', 'private_key': self.rsa_key},
+                               {'kid': 'ec', 'algorithm': 'ES256', 'private_key': self.ec_key}):
+            response = self.client.get('/jwt/jwks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        rsa_jwk, ec_jwk = response.data['keys']
+        self.assertEqual((rsa_jwk['kty'], rsa_jwk['kid'], rsa_jwk['alg'], rsa_jwk['e']), ('RSA', 'rsa', 'RS256', 'AQAB'))
+        self.assertEqual((ec_jwk['kty'], ec_jwk['crv'], ec_jwk['kid']), ('EC', 'P-256', 'ec'))
+        self.assertNotIn('d', ec_jwk)
+        # PyJWT 能用 JWK 中的公钥验证
+        public_key = jwt_utils.jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(rsa_jwk))
+        with self.signing_keys({'kid': 'rsa', 'algorithm': 'RS256', 'private_key': self.rsa_key}):
+            token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        self.assertEqual(jwt_utils.jwt.decode(token, public_key, algorithms=['RS256'])['username'], 'durant')
+
+    def test_jwks_without_keys(self):
+        response = self.client.get('/jwt/jwks/')
+        self.assertEqual(response.data, {'keys': []})
+
+
+class RevocationTestCase(APITestCase):
+
+    def setUp(self):
+        jwt_utils.jwt_decode_cache.clear()
+        revocation_list.clear()
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123')
+        self.payload = jwt_utils.jwt_payload_handler(self.user)
+        self.token = jwt_utils.jwt_encode_handler(self.payload)
+        self.payload = jwt_utils.jwt_decode_handler(self.token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.token}')
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_logout(self):
+        self.assertEqual(self.client.get('/account/info/').status_code, 200)
+        self.assertEqual(self.client.post('/account/logout/').status_code, 204)
+        response = self.client.get('/account/info/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data['detail'], gettext('Token has been revoked.'))
+        response = self.client.post('/jwt/refresh/', {'token': self.token}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(RevokedToken.objects.get().user, self.user)
+
+    def test_no_query_when_not_revoked(self):
+        revoke_token(jwt_utils.jwt_decode_handler(
+            jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))))
+        revocation_list.get()
+        with mock.patch('account.revocation.RevokedToken.objects.filter') as query:
+            self.assertFalse(jwt_utils.jwt_is_revoked(self.payload))
+        query.assert_not_called()
+
+    def test_incremental_reload(self):
+        revocation_list.get()
+        # 其他进程吊销的 token
+        RevokedToken.objects.create(jti=self.payload['jti'], expires=datetime.now() + timedelta(days=1))
+        self.assertEqual(self.client.get('/account/info/').status_code, 200)
+        with mock.patch('account.revocation.time.monotonic', return_value=time.monotonic() + 10):
+            with self.assertNumQueries(2):
+                self.assertTrue(jwt_utils.jwt_is_revoked(self.payload))
+
+    def test_purge_expired(self):
+        RevokedToken.objects.create(jti='expired', expires=datetime.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='active', expires=datetime.now() + timedelta(days=1))
+        revocation_list.get()
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['active'])
+
+    def test_late_commit_reloaded(self):
+        RevokedToken.objects.create(pk=100, jti='later', expires=datetime.now() + timedelta(days=1))
+        revocation_list.get()
+        # 其他进程的事务先分配了较小的主键，在较大的主键已加载之后才提交
+        RevokedToken.objects.create(pk=50, jti=self.payload['jti'], expires=datetime.now() + timedelta(days=1))
+        RevokedToken.objects.filter(pk=50).update(created=revocation_list.loaded - timedelta(seconds=30))
+        with mock.patch('account.revocation.time.monotonic', return_value=time.monotonic() + 10):
+            self.assertTrue(jwt_utils.jwt_is_revoked(self.payload))
+        # 重叠的时间窗口不重复计数
+        count = revocation_list.filter.count
+        revocation_list.refresh()
+        self.assertEqual(revocation_list.filter.count, count)
+
+    @override_settings(JWT_AUTH={**settings.JWT_AUTH, 'JWT_LEEWAY': timedelta(minutes=5)})
+    def test_purge_after_leeway(self):
+        RevokedToken.objects.create(jti='expired', expires=datetime.now() - timedelta(minutes=6))
+        RevokedToken.objects.create(jti='leeway', expires=datetime.now() - timedelta(minutes=1))
+        self.assertEqual(purge_expired_tokens(), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['leeway'])
+
+
+class LoginHashingTestCase(APITestCase):
+
+    def setUp(self):
+        hashing_pool.stats.reset()
+        memory_buckets.clear()
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123')
+
+    def login(self, password='cecpanda123'):
+        return self.client.post('/jwt/auth/', {'username': 'durant', 'password': password}, format='json')
+
+    def test_login(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.client.post('/jwt/auth/', {'username': 'nobody', 'password': 'cecpanda123'}, format='json')
+        stats = hashing_pool.stats.as_dict()
+        self.assertEqual((stats['completed'], stats['rejected']), (3, 0))
+        self.assertGreater(stats['hash_max_ms'], 0)
+
+    @override_settings(ACCOUNT={**settings.ACCOUNT, 'LOGIN_HASH_WORKERS': 1, 'LOGIN_HASH_QUEUE': 0,
+                                'LOGIN_HASH_RETRY_AFTER': 3})
+    def test_full_pool(self):
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=hashing_pool.run, args=(block,))
+        worker.start()
+        started.wait(5)
+        try:
+            response = self.login()
+            # admin 登录不使用线程池，不会因为 LoginBusy 返回 500
+            UserModel.objects.create_user(username='admin', password='cecpanda123', is_staff=True)
+            admin_response = Client().post('/admin/login/', {'username': 'admin', 'password': 'cecpanda123'})
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(hashing_pool.stats.as_dict()['rejected'], 1)
+        self.assertEqual(admin_response.status_code, 302)
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+                                         'django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+    def test_hash_upgrade(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha1$'))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+                                         'django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+    def test_hash_upgrade_full_pool(self):
+        run = hashing_pool.run
+
+        def saturated(func, *args):
+            # 校验密码之后线程池被其他登录占满
+            if func is hashers.make_password:
+                hashing_pool.stats.reject()
+                raise LoginBusy(1)
+            return run(func, *args)
+
+        with mock.patch.object(hashing_pool, 'run', side_effect=saturated):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(hashing_pool.stats.as_dict()['rejected'], 1)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha1$'))
+
+
+class LoginThrottleTestCase(APITestCase):
+
+    def setUp(self):
+        memory_buckets.clear()
+        hashing_pool.stats.reset()
+        UserModel.objects.create_user(username='durant', password='cecpanda123')
+
+    def login(self, username='durant', password='wrong', ip='10.0.0.1'):
+        return self.client.post('/jwt/auth/', {'username': username, 'password': password},
+                                format='json', REMOTE_ADDR=ip)
+
+    def test_username_bucket(self):
+        for i in range(5):
+            self.assertEqual(self.login().status_code, 400)
+        response = self.login(password='cecpanda123')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # 被拒绝的请求不计算哈希
+        self.assertEqual(hashing_pool.stats.as_dict()['completed'], 5)
+        self.assertEqual(self.login(username='DURANT').status_code, 429)
+        self.assertEqual(self.login(username='curry').status_code, 400)
+        # 其他 IP 上的尝试不影响用户自己登录
+        self.assertEqual(self.login(ip='10.0.0.2', password='cecpanda123').status_code, 200)
+
+    @override_settings(ACCOUNT={**settings.ACCOUNT, 'LOGIN_THROTTLE_RATES': {'username': None, 'ip': '3/min'}})
+    def test_spoofed_forwarded_for(self):
+        for i in range(3):
+            self.assertEqual(self.client.post('/jwt/auth/', {'username': 'durant', 'password': 'wrong'}, format='json',
+                                              REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'10.1.0.{i}').status_code, 400)
+        response = self.client.post('/jwt/auth/', {'username': 'durant', 'password': 'wrong'}, format='json',
+                                    REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='10.1.0.9')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(ACCOUNT={**settings.ACCOUNT, 'LOGIN_THROTTLE_RATES': {'username': None, 'ip': '3/min'}})
+    def test_ip_bucket(self):
+        for i in range(3):
+            self.assertEqual(self.login(username=f'user{i}').status_code, 400)
+        self.assertEqual(self.login(username='curry').status_code, 429)
+        self.assertEqual(self.login(username='curry', ip='10.0.0.2').status_code, 400)
+
+    def test_refill(self):
+        for i in range(5):
+            self.login()
+        self.assertEqual(self.login().status_code, 429)
+        with mock.patch('account.throttling.time.time', return_value=time.time() + 13):
+            self.assertEqual(self.login(password='cecpanda123').status_code, 200)
+
+    @override_settings(ACCOUNT={**settings.ACCOUNT, 'LOGIN_THROTTLE_CACHE': 'default'})
+    def test_cache_backend(self):
+        cache.clear()
+        for i in range(5):
+            self.login()
+        self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(len(memory_buckets.buckets), 0)
+
+
+class LoginBundleTestCase(APITestCase):
+
+    def setUp(self):
+        memory_buckets.clear()
+        d = Department.objects.create(name='信息工程部', code='it')
+        r = Room.objects.create(name='CIM', code='cim', department=d)
+        r.permissions.add(Permission.objects.get(codename='view_room'))
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=r)
+
+    def test_login_bundle(self):
+        response = self.client.post('/jwt/auth/?bootstrap=1', {'username': 'durant', 'password': 'cecpanda123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {data["token"]}')
+        self.assertEqual(data['info'], self.client.get('/account/info/').data)
+        self.assertEqual(data['permission'], self.client.get('/account/permission/').data)
+        self.assertEqual(data['departments'], self.client.get('/account/department/').data)
+        self.assertTrue(data['permission']['permissions']['account']['room']['view'])
+
+    def test_opt_in(self):
+        response = self.client.post('/jwt/auth/', {'username': 'durant', 'password': 'cecpanda123'}, format='json')
+        self.assertEqual(set(response.data), {'token'})
+        # 刷新时不返回启动数据
+        response = self.client.post('/jwt/refresh/?bootstrap=1', {'token': response.data['token']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'token'})
+
+
+class PermissionClaimTestCase(APITestCase):
+
+    def setUp(self):
+        memory_buckets.clear()
+        get_permission_catalog()
+        d = Department.objects.create(name='信息工程部', code='it')
+        r = Room.objects.create(name='CIM', code='cim', department=d)
+        r.permissions.add(Permission.objects.get(codename='view_room'))
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123', room=r)
+        self.user.user_permissions.add(Permission.objects.get(codename='change_user'))
+
+    def login(self):
+        response = self.client.post('/jwt/auth/', {'username': 'durant', 'password': 'cecpanda123'}, format='json')
+        return response.data['token']
+
+    def test_claim(self):
+        payload = jwt_utils.jwt_decode_handler(self.login())
+        self.assertEqual(payload['perms_ver'], get_permission_catalog().version)
+        perms = decode_permission_claim(payload)
+        self.assertEqual(set(perms), {'account.view_room', 'account.change_user'})
+        self.assertEqual(set(perms), UserModel.objects.get(pk=self.user.pk).get_all_permissions())
+
+    def test_catalog_endpoint(self):
+        payload = jwt_utils.jwt_decode_handler(self.login())
+        response = self.client.get('/account/permission-catalog/')
+        self.assertEqual(response.data['version'], payload['perms_ver'])
+        data = payload['perms'] + '=' * (-len(payload['perms']) % 4)
+        mask = int.from_bytes(base64.urlsafe_b64decode(data), 'little')
+        names = {name for pk, name in response.data['permissions'].items() if mask >> pk & 1}
+        self.assertEqual(names, {'account.view_room', 'account.change_user'})
+        response = self.client.get('/account/permission-catalog/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_claim(self):
+        token = self.login()
+        Permission.objects.create(codename='view_cvd', name='view cvd',
+                                  content_type=ContentType.objects.get_for_model(Room))
+        self.assertIsNone(decode_permission_claim(jwt_utils.jwt_decode_handler(token)))
+        response = self.client.post('/jwt/refresh/', {'token': token}, format='json')
+        payload = jwt_utils.jwt_decode_handler(response.data['token'])
+        self.assertEqual(payload['perms_ver'], get_permission_catalog().version)
+        self.assertIsNotNone(decode_permission_claim(payload))
+
+
+class FastLaneTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = UserModel.objects.create_user(username='durant', password='cecpanda123')
+        self.admin = UserModel.objects.create_superuser('admin', 'admin@cec.com', 'cecpanda123')
+        self.token = jwt_utils.jwt_encode_handler(jwt_utils.jwt_payload_handler(self.user))
+        # 浏览器中同时登录了 admin
+        self.client.force_login(self.admin)
+
+    def test_jwt_request_skips_session(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.token}')
+        self.client.get('/account/info/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/account/info/')
+        self.assertEqual(response.data['username'], 'durant')
+        self.assertFalse([q for q in ctx.captured_queries if 'django_session' in q['sql']])
+        # 不删除浏览器的会话 cookie
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertTrue(response.wsgi_request.jwt_fast_lane)
+
+    def test_browser_request_uses_session(self):
+        response = self.client.get('/account/info/')
+        self.assertEqual(response.data['username'], 'admin')
+        self.assertFalse(response.wsgi_request.jwt_fast_lane)
+
+    def test_csrf_still_enforced_for_sessions(self):
+        client = APIClient(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post('/account/logout/')
+        self.assertEqual(response.status_code, 403)
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {self.token}')
+        self.assertEqual(client.post('/account/logout/').status_code, 204)
+
+
+class QueryBudgetTestCase(APITestCase):
+    """
+    每个列表、详情接口的查询数固定，不随返回的对象数增加
+    """
+    # 接口: 最多的查询数
+    budgets = {
+        '/account/user/?page-size=100': 3,
+        '/account/user/{username}/': 2,
+        '/account/department/': 2,
+        '/account/department/{department}/': 2,
+        '/account/room/': 2,
+        '/account/room/{room}/': 2,
+        '/account/info/': 3,
+        '/account/permission/': 3,
+    }
+
+    def setUp(self):
+        cache.clear()
+        get_permission_catalog()
+        get_content_type_catalog()
+        self.groups = [Group.objects.create(name=f'group{i}') for i in range(3)]
+        self.create_data(2)
+        self.user = UserModel.objects.filter(room__isnull=False).first()
+
+    def create_data(self, count):
+        for _ in range(count):
+            d = Department.objects.create(name=fake.pystr(max_chars=10), code=fake.pystr(max_chars=5))
+            for _ in range(3):
+                r = Room.objects.create(name=fake.pystr(max_chars=10), code=fake.pystr(max_chars=10), department=d)
+                r.groups.set(self.groups)
+                for _ in range(3):
+                    user = UserModel.objects.create(username=fake.pystr(max_chars=20), room=r)
+                    user.groups.set(self.groups)
+
+    def count_queries(self):
+        counts = {}
+        for url, budget in self.budgets.items():
+            url = url.format(username=self.user.username, department=self.user.room.department_id,
+                             room=self.user.room_id)
+            # 每次都是缓存为空、新查出的用户，统计最多的情况
+            cache.clear()
+            self.client.force_authenticate(user=UserModel.objects.get(pk=self.user.pk))
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertLessEqual(len(ctx), budget, f'{url}: {[q["sql"] for q in ctx.captured_queries]}')
+            counts[url] = len(ctx)
+        return counts
+
+    def test_query_budget(self):
+        before = self.count_queries()
+        self.create_data(5)
+        self.assertEqual(self.count_queries(), before)
+
+
+class UserCursorPaginationTestCase(APITestCase):
+
+    def setUp(self):
+        UserModel.objects.bulk_create([UserModel(username=f'user{i:03}', password='123') for i in range(25)])
+        self.client.force_authenticate(user=UserModel.objects.first())
+
+    def walk(self, url):
+        usernames, pages = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            pages.append(ctx.captured_queries)
+            usernames += [user['username'] for user in response.data['results']]
+            url = response.data['next']
+        return usernames, pages
+
+    def test_walk_all_pages(self):
+        usernames, pages = self.walk('/account/user/?paging=cursor&page-size=10')
+        self.assertEqual(usernames, [f'user{i:03}' for i in range(25)])
+        self.assertEqual(len(pages), 3)
+        # 不统计总数，深翻页的查询数与第一页相同
+        self.assertFalse([q for page in pages for q in page if 'COUNT' in q['sql']])
+        self.assertEqual(len(set(len(page) for page in pages)), 1)
+        self.assertIn('"account_user"."id" >', pages[-1][0]['sql'])
+
+    def test_count_on_request(self):
+        response = self.client.get('/account/user/?paging=cursor&count=1')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertNotIn('count', self.client.get('/account/user/?paging=cursor').data)
+
+    def test_page_number_by_default(self):
+        self.assertEqual(self.client.get('/account/user/').data['count'], 25)
+
+
+def fake_pinyin(text):
+    table = {'张': 'zhang', '三': 'san', '丰': 'feng', '李': 'li', '四': 'si'}
+    return [table.get(char, char) for char in text]
+
+
+class UserSearchTestCase(APITestCase):
+
+    def setUp(self):
+        d = Department.objects.create(name='信息工程部', code='it')
+        r = Room.objects.create(name='CIM', code='cim', department=d)
+        with mock.patch('account.search.lazy_pinyin', fake_pinyin):
+            self.zhang = UserModel.objects.create(username='zsf01', realname='张三丰', mobile='13812345678',
+                                                  email='zsf@cec.com', room=r)
+            self.li = UserModel.objects.create(username='lisi', realname='李四', mobile='13900001111')
+        self.client.force_authenticate(user=self.li)
+
+    def search(self, query):
+        return [user['username'] for user in self.client.get('/account/user/', {'search': query}).data['results']]
+
+    def test_search(self):
+        self.assertEqual(self.search('三丰'), ['zsf01'])
+        self.assertEqual(self.search('张'), ['zsf01'])
+        self.assertEqual(self.search('sanfeng'), ['zsf01'])
+        self.assertEqual(self.search('zsf'), ['zsf01'])
+        self.assertEqual(self.search('5678'), ['zsf01'])
+        self.assertEqual(self.search('cec'), ['zsf01'])
+        self.assertEqual(self.search('信息'), ['zsf01'])
+        self.assertEqual(self.search('cim 张'), ['zsf01'])
+        self.assertEqual(self.search('cim 李'), [])
+        self.assertEqual(self.search('LI'), ['lisi'])
+        self.assertEqual(len(self.client.get('/account/user/').data['results']), 2)
+
+    def test_kept_in_sync(self):
+        self.li.realname = '王五'
+        self.li.save()
+        self.assertEqual(self.search('李四'), [])
+        self.assertEqual(self.search('王五'), ['lisi'])
+        department = Department.objects.get(code='it')
+        department.name = '制造部'
+        department.save()
+        self.assertEqual(self.search('制造'), ['zsf01'])
+        self.assertEqual(self.search('信息'), [])
+        # 只更新 last_login 时不重建
+        with self.assertNumQueries(1):
+            self.li.save(update_fields=['last_login'])
+
+    def test_search_by_id(self):
+        UserModel.objects.create(pk=987654, username='wangwu')
+        self.assertEqual(self.search('987654'), ['wangwu'])
+        # 手机号的后缀仍然匹配
+        self.assertEqual(self.search('5678'), ['zsf01'])
+
+    def test_migration_indexes_existing_users(self):
+        index_existing_users = import_module('account.migrations.0006_index_existing_users').index_existing_users
+        UserSearchToken.objects.all().delete()
+        index_existing_users(django_apps, None)
+        self.assertEqual(self.search('李四'), ['lisi'])
+        self.assertEqual(self.search('5678'), ['zsf01'])
+
+    def test_rebuild_command(self):
+        UserSearchToken.objects.all().delete()
+        call_command('rebuild_search_index', stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+        self.assertEqual(self.search('5678'), ['zsf01'])
+
+    def test_admin_search(self):
+        self.client.force_login(UserModel.objects.create_superuser('admin', 'admin@cec.com', 'cecpanda123'))
+        response = self.client.get('/admin/account/user/', {'q': '三丰'})
+        self.assertEqual([user.username for user in response.context['cl'].result_list], ['zsf01'])
+
+
+class UserExportTestCase(APITestCase):
+
+    def setUp(self):
+        d = Department.objects.create(name='信息工程部', code='it')
+        r = Room.objects.create(name='CIM', code='cim', department=d)
+        group = Group.objects.create(name='开发')
+        self.zhang = UserModel.objects.create(username='zhang', realname='张三', mobile='13812345678', room=r)
+        self.zhang.groups.set([group, Group.objects.create(name='运维')])
+        self.li = UserModel.objects.create(username='li', realname='李四', is_active=False)
+        self.client.force_authenticate(user=self.zhang)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response = self.client.get('/account/user/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['zhang', 'li'])
+        self.assertEqual(rows[0]['department'], '信息工程部')
+        self.assertEqual(rows[0]['room'], 'CIM')
+        self.assertEqual(rows[0]['groups'], ['开发', '运维'])
+        self.assertEqual((rows[1]['room'], rows[1]['groups'], rows[1]['is_active']), (None, [], False))
+
+    def test_csv(self):
+        response = self.client.get('/account/user/export/', {'export': 'csv', 'search': '张'})
+        lines = self.read(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'username', 'realname'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('信息工程部,CIM,"开发,运维"', lines[1])
+        self.assertEqual(self.client.get('/account/user/export/', {'export': 'xml'}).status_code, 400)
+
+    def test_queries_per_chunk(self):
+        for i in range(9):
+            UserModel.objects.create(username=f'user{i}').groups.set(Group.objects.all())
+        with mock.patch('account.export.CHUNK_SIZE', 5), CaptureQueriesContext(connection) as ctx:
+            rows = list(export_rows())
+        self.assertEqual(len(rows), 11)
+        # 部门、科室、团队各 1 次，3 段用户各 2 次
+        self.assertEqual(len(ctx), 3 + 3 * 2)
+
+    def test_command(self):
+        path = os.path.join(settings.BASE_DIR, 'users-export-test.csv')
+        try:
+            call_command('export_users', '--format', 'csv', '--output', path, stderr=open(os.devnull, 'w'))
+            with open(path, encoding='utf-8-sig') as f:
+                self.assertEqual(len(f.read().splitlines()), 3)
+        finally:
+            os.remove(path)
+
+
+class UserImportTestCase(APITestCase):
+    header = 'username,password,realname,email,room,department,groups,permissions\n'
+
+    def setUp(self):
+        cache.clear()
+        d = Department.objects.create(name='信息工程部', code='it')
+        Room.objects.create(name='CIM', code='cim', department=d)
+        self.dev, self.ops = Group.objects.create(name='开发'), Group.objects.create(name='运维')
+        self.li = UserModel.objects.create(username='li', realname='李四')
+        self.li.groups.set([self.ops])
+
+    def rows(self, text):
+        return read_rows(io.StringIO(self.header + text), 'csv')
+
+    def test_upsert(self):
+        # 导入前缓存 li 的权限
+        self.assertFalse(UserModel.objects.get(username='li').has_perm('account.view_user'))
+        rows = self.rows('zhang,cec123456,张三,zhang@cec.com,CIM,IT,"开发,运维",account.view_user\n'
+                         'li,,李四,,cim,,开发,account.view_user\n')
+        self.assertEqual(import_users(rows), {'created': 1, 'updated': 1, 'unchanged': 0})
+
+        zhang = UserModel.objects.get(username='zhang')
+        self.assertTrue(zhang.check_password('cec123456'))
+        self.assertEqual((zhang.realname, zhang.room.code), ('张三', 'cim'))
+        self.assertEqual(set(zhang.groups.all()), {self.dev, self.ops})
+        li = UserModel.objects.get(username='li')
+        self.assertEqual(list(li.groups.all()), [self.dev])
+        # 已有用户的密码不修改
+        self.assertEqual(li.password, '')
+        self.assertTrue(li.has_perm('account.view_user'))
+        self.assertEqual(list(search_users(UserModel.objects.all(), '张三')), [zhang])
+
+        # 重复导入不修改
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(import_users(rows), {'created': 0, 'updated': 0, 'unchanged': 2})
+        self.assertFalse([q for q in ctx.captured_queries if not q['sql'].startswith('SELECT')])
+
+    def test_dry_run_and_errors(self):
+        rows = self.rows('zhang,,,,cim,,,\n')
+        self.assertEqual(import_users(rows, dry_run=True), {'created': 1, 'updated': 0, 'unchanged': 0})
+        self.assertFalse(UserModel.objects.filter(username='zhang').exists())
+
+        rows = self.rows('zhang,,,,cim,xx,,\n'
+                         'wang,,,,mes,,,\n'
+                         'zhao,,,,,,测试,\n'
+                         'li,,,not-an-email,,,,\n'
+                         'zhao,,,,,,,\n'
+                         'zhao,,,,,,,\n')
+        with self.assertRaises(ImportFailed) as cm:
+            import_users(rows)
+        self.assertEqual([number for number, _ in cm.exception.errors], [2, 3, 4, 5, 7])
+        self.assertEqual(UserModel.objects.count(), 1)
+
+    def test_json_clears_groups(self):
+        rows = read_rows(io.StringIO('{"username": "li", "groups": []}\n{"username": "wang", "is_active": false}'),
+                         'json')
+        self.assertEqual(import_users(rows), {'created': 1, 'updated': 1, 'unchanged': 0})
+        self.assertFalse(self.li.groups.exists())
+        self.assertFalse(UserModel.objects.get(username='wang').is_active)
+
+    def test_queries(self):
+        def count(start):
+            text = ''.join(f'user{i},,,,cim,,开发,account.view_user\n' for i in range(start, start + 20))
+            with CaptureQueriesContext(connection) as ctx:
+                import_users(self.rows(text))
+            return len(ctx)
+        self.assertEqual(count(0), count(100))
+
+    def test_command_and_admin(self):
+        path = os.path.join(settings.BASE_DIR, 'users-import-test.csv')
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.header + 'zhang,,,,cim,,,\n')
+            call_command('import_users', path, stdout=open(os.devnull, 'w'))
+        finally:
+            os.remove(path)
+        self.assertTrue(UserModel.objects.filter(username='zhang').exists())
+
+        client = Client()
+        client.force_login(UserModel.objects.create_superuser('admin', 'admin@cec.com', 'cecpanda123'))
+        self.assertContains(client.get('/admin/account/user/'), '/admin/account/user/import/')
+        upload = SimpleUploadedFile('users.csv', (self.header + 'wang,,王五,,,,,\n').encode('utf-8'))
+        response = client.post('/admin/account/user/import/', {'file': upload, 'format': 'csv'})
+        self.assertRedirects(response, '/admin/account/user/')
+        self.assertEqual(UserModel.objects.get(username='wang').realname, '王五')
+
+    def test_malformed_files(self):
+        with self.assertRaises(ImportFailed) as cm:
+            self.rows('zhang,,,,cim,,,\n' + 'x' * 200000 + ',,,,,,,\n')
+        self.assertEqual([number for number, _ in cm.exception.errors], [3])
+        with self.assertRaises(ImportFailed) as cm:
+            read_rows(io.StringIO('{"username": "li"}\n{"username": \n'), 'json')
+        self.assertEqual([number for number, _ in cm.exception.errors], [2])
+
+        path = os.path.join(settings.BASE_DIR, 'users-import-test.csv')
+        try:
+            with open(path, 'w', encoding='gbk') as f:
+                f.write(self.header + 'zhang,,张三,,cim,,,\n')
+            with self.assertRaisesMessage(CommandError, '文件不是 UTF-8 编码'):
+                call_command('import_users', path, stdout=open(os.devnull, 'w'))
+        finally:
+            os.remove(path)
+
+        client = Client()
+        client.force_login(UserModel.objects.create_superuser('admin', 'admin@cec.com', 'cecpanda123'))
+        upload = SimpleUploadedFile('users.csv', (self.header + 'wang,,王五,,,,,\n').encode('gbk'))
+        response = client.post('/admin/account/user/import/', {'file': upload, 'format': 'csv'})
+        self.assertFormError(response, 'form', 'file', '无法读取文件：文件不是 UTF-8 编码')
+        upload = SimpleUploadedFile('users.json', b'[{"username": "wang"},]')
+        response = client.post('/admin/account/user/import/', {'file': upload, 'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['form'].errors['file']), 1)
+        self.assertFalse(UserModel.objects.filter(username__in=['zhang', 'wang']).exists())
+
+
 class UserInfoTestCase(APITestCase):
 
     def setUp(self):
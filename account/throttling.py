@@ -0,0 +1,137 @@
+"""
+/jwt/auth/ 的登录限流，在计算密码哈希之前拒绝过多的尝试
+
+按 IP 和按 (IP, 用户名) 各有一个令牌桶，速率写成 '5/min' 的形式：桶的容量为 5，每分钟补充 5 个。
+两个桶都有令牌时才允许登录，各消耗一个。用户名的桶按 IP 区分，其他人用某个用户名反复尝试，
+不会让这个用户在自己的 IP 上无法登录。
+
+IP 由 DRF 的 get_ident 取得，REST_FRAMEWORK['NUM_PROXIES'] 必须与前面反向代理的层数一致，
+否则客户端可以伪造 X-Forwarded-For 绕过按 IP 的限制。
+
+令牌桶默认保存在进程内，同一进程的线程共享；设置 LOGIN_THROTTLE_CACHE 后保存在缓存中，
+多个进程共享（读写不是原子的，并发时的限制是近似的）。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .settings import account_settings
+
+
+UserModel = get_user_model()
+
+BUCKET_KEY = 'account:login-throttle:%s:%s'
+
+# 进程内最多保存的令牌桶数，超出时丢弃最久未使用的
+MAX_BUCKETS = 100000
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """
+    '5/min' -> (容量 5, 每秒补充 5 / 60 个)
+    """
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+class MemoryBuckets:
+    """
+    进程内的令牌桶 {key: (令牌数, 更新时间)}
+    """
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self.lock:
+            return {key: self.buckets[key] for key in keys if key in self.buckets}
+
+    def set_many(self, values):
+        with self.lock:
+            for key, value in values.items():
+                self.buckets[key] = value
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+memory_buckets = MemoryBuckets()
+
+
+class CacheBuckets:
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set_many(self, values):
+        # 桶空的令牌最多一天补满
+        self.cache.set_many(values, 60 * 60 * 24)
+
+
+def get_buckets():
+    alias = account_settings.LOGIN_THROTTLE_CACHE
+    return CacheBuckets(caches[alias]) if alias else memory_buckets
+
+
+class LoginThrottle(BaseThrottle):
+    """
+    按 IP 和 (IP, 用户名) 的令牌桶限流，速率见 LOGIN_THROTTLE_RATES
+    """
+    lock = threading.Lock()
+
+    def get_idents(self, request):
+        ip = self.get_ident(request)
+        idents = {'ip': ip}
+        try:
+            username = request.data.get(UserModel.USERNAME_FIELD)
+        except AttributeError:
+            username = None
+        if isinstance(username, str) and username:
+            # 用户名不区分大小写地计数，避免换大小写绕过
+            idents['username'] = f'{ip}:{username.lower()}'
+        return idents
+
+    def allow_request(self, request, view):
+        rates = account_settings.LOGIN_THROTTLE_RATES
+        idents = {
+            BUCKET_KEY % (scope, ident): parse_rate(rates[scope])
+            for scope, ident in self.get_idents(request).items()
+            if rates.get(scope)
+        }
+        if not idents:
+            return True
+
+        buckets = get_buckets()
+        now = time.time()
+        self.delay = 0
+        with self.lock:
+            current = buckets.get_many(list(idents))
+            tokens = {}
+            for key, (capacity, refill) in idents.items():
+                available, last = current.get(key, (capacity, now))
+                tokens[key] = min(capacity, available + (now - last) * refill)
+                if tokens[key] < 1:
+                    self.delay = max(self.delay, (1 - tokens[key]) / refill)
+            # 任何一个桶空了都拒绝，且不消耗另一个桶的令牌
+            cost = 0 if self.delay else 1
+            buckets.set_many({key: (value - cost, now) for key, value in tokens.items()})
+        return not self.delay
+
+    def wait(self):
+        return self.delay
@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import (DepartmentViewSet, RoomViewSet, UserViewSet,
-                    UserInfoView, PermissionsView)
+                    UserInfoView, PermissionsView, PermissionCatalogView,
+                    LogoutView, CacheStatsView)
 
 
 app_name = 'account'
@@ -16,5 +17,8 @@ router.register('user',       UserViewSet,       base_name='user')
 urlpatterns = [
     path('', include(router.urls)),
     path('info/', UserInfoView.as_view()),
-    path('permission/', PermissionsView.as_view())
+    path('permission/', PermissionsView.as_view()),
+    path('permission-catalog/', PermissionCatalogView.as_view()),
+    path('logout/', LogoutView.as_view()),
+    path('cache-stats/', CacheStatsView.as_view()),
 ]
@@ -1,5 +1,13 @@
+import base64
+
 from faker import Faker, Factory
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework_jwt.settings import api_settings
+from rest_framework_jwt.utils import jwt_payload_handler as default_jwt_payload_handler
+
+from .catalog import PermissionSet, encode_permissions, get_permission_catalog
+from .models import Department
+from .serializers import DepartmentSerializer, PermissionsSerializer, UserInfoSerializer
 
 
 fake = Faker()
@@ -10,3 +18,94 @@ class UserPagination(PageNumberPagination):
     page_size_query_param = 'page-size'
     page_query_param = "page"
     max_page_size = 100
+
+
+class UserCursorPagination(CursorPagination):
+    '''
+    按 id 翻页的游标分页，每页是一次 WHERE id > ? 的索引查询，翻到多深耗时都一样
+    默认不统计总数，?count=1 时才统计
+    '''
+    ordering = 'id'
+    page_size = UserPagination.page_size
+    page_size_query_param = UserPagination.page_size_query_param
+    max_page_size = UserPagination.max_page_size
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+            response.data.move_to_end('count', last=False)
+        return response
+
+
+def jwt_get_user_secret_key(user):
+    '''
+    JWT_GET_USER_SECRET_KEY：每个用户单独的签名密钥，User.rotate_secret() 后旧 token 失效
+    其他进程在 JWT_USER_SECRET_MEMORY_TTL 秒内失效，JWT_USER_CACHE 必须是共享的缓存或 None；
+    不能与 JWT_SIGNING_KEYS 同时使用，见 account.checks
+    '''
+    return f'{api_settings.JWT_SECRET_KEY}:{user.secret.hex}'
+
+
+# 登录时返回启动数据的查询参数
+BOOTSTRAP_QUERY_PARAM = 'bootstrap'
+
+
+def jwt_response_payload_handler(token, user=None, request=None):
+    '''
+    JWT_RESPONSE_PAYLOAD_HANDLER：登录时带上 ?bootstrap=1，响应中附带前端启动需要的数据，
+    与 /account/info/、/account/permission/、/account/department/ 的内容相同，
+    菜单和权限走同样的缓存，前端登录后不必再发这三个请求
+    默认和刷新（/jwt/refresh/）时只返回 token，不给登录高峰和网关刷新增加负担
+    '''
+    # rest_framework_jwt.views 导入时就读取这个函数，不能在模块级导入
+    from rest_framework_jwt.views import ObtainJSONWebToken
+
+    view = request.parser_context.get('view') if request is not None else None
+    if not isinstance(view, ObtainJSONWebToken) or request.query_params.get(BOOTSTRAP_QUERY_PARAM) != '1':
+        return {'token': token}
+
+    context = {'request': request}
+    departments = DepartmentSerializer.setup_eager_loading(Department.objects.all())
+    return {
+        'token': token,
+        'info': UserInfoSerializer(user, context=context).data,
+        'permission': PermissionsSerializer(user, context=context).data,
+        'departments': DepartmentSerializer(departments, many=True, context=context).data,
+    }
+
+
+def jwt_payload_handler(user):
+    '''
+    JWT_PAYLOAD_HANDLER：在默认的 payload 中加入用户的有效权限
+        perms      以权限主键为下标的位图，小端字节序，base64url 编码
+        perms_ver  权限目录的版本，见 /account/permission-catalog/
+    其他服务可以据此在本地判断权限，目录版本变化后通过 /jwt/refresh/ 取得新的 token
+    权限来源变化后，已签发 token 中的权限要到刷新时才会更新
+    '''
+    payload = default_jwt_payload_handler(user)
+    mask = encode_permissions(user.get_all_permissions())
+    catalog = get_permission_catalog()
+    data = PermissionSet(mask, catalog).to_bytes()
+    payload['perms'] = base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+    payload['perms_ver'] = catalog.version
+    return payload
+
+
+def decode_permission_claim(payload, catalog=None):
+    '''
+    由 payload 中的 perms 还原权限集合，目录版本不一致（或没有这两项）时返回 None
+    '''
+    catalog = catalog or get_permission_catalog()
+    if 'perms' not in payload or payload.get('perms_ver') != catalog.version:
+        return None
+    data = payload['perms']
+    data = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    return PermissionSet.from_bytes(data, catalog)
@@ -1,14 +1,22 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.http import StreamingHttpResponse
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.generics import GenericAPIView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.decorators import action
 
+from .cache import CACHE_STATS
+from .catalog import get_permission_catalog
+from .export import FORMATS, export_lines
+from .hashing import hashing_pool
 from .models import (Department, Room)
+from .revocation import revoke_token
+from .search import search_users
 from .serializers import (DepartmentSerializer,
                           RoomSerializer,
                           UserSerializer,
@@ -17,28 +25,43 @@ from .serializers import (DepartmentSerializer,
                           ChangePasswordSerializer,
                           UserInfoSerializer,
                           PermissionSerializer,
+                          BatchPermissionSerializer,
                           PermissionsSerializer)
-from .utils import UserPagination
+from .utils import UserCursorPagination, UserPagination
 
 
 UserModel = get_user_model()
 
 
-class DepartmentViewSet(ListModelMixin,
+class EagerLoadingViewMixin:
+    """
+    按序列化器的 setup_eager_loading 预加载关联数据，查询数与返回的对象数无关
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        setup = getattr(self.get_serializer_class(), 'setup_eager_loading', None)
+        return setup(queryset) if setup else queryset
+
+
+class DepartmentViewSet(EagerLoadingViewMixin,
+                        ListModelMixin,
                         RetrieveModelMixin,
                         GenericViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
 
 
-class RoomViewSet(ListModelMixin,
+class RoomViewSet(EagerLoadingViewMixin,
+                  ListModelMixin,
                   RetrieveModelMixin,
                   GenericViewSet):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
 
 
-class UserViewSet(ListModelMixin,
+class UserViewSet(EagerLoadingViewMixin,
+                  ListModelMixin,
                   RetrieveModelMixin,
                   GenericViewSet):
     lookup_field = 'username'
@@ -46,6 +69,27 @@ class UserViewSet(ListModelMixin,
     # serializer_class = UserSerializer
     pagination_class = UserPagination
     permission_classes = [IsAuthenticated,]
+    # ?search= 搜索用户，见 account.search
+    # ?paging=cursor 时使用游标分页，见 UserCursorPagination
+    paging_query_param = 'paging'
+    # export/?export=csv 导出的格式，format 已被 DRF 占用
+    export_query_param = 'export'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get('search')
+        if self.action in ('list', 'export') and search:
+            queryset = search_users(queryset, search)
+        return queryset
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get(self.paging_query_param) == 'cursor':
+                self._paginator = UserCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_serializer_class(self):
         if self.action == 'change_avatar':
@@ -56,8 +100,20 @@ class UserViewSet(ListModelMixin,
             return ChangePasswordSerializer
         elif self.action == 'get_permission':
             return PermissionSerializer
+        elif self.action == 'batch_permission':
+            return BatchPermissionSerializer
         return UserSerializer
 
+    @action(methods=['get'], detail=False, url_path='export', url_name='export')
+    def export(self, request):
+        export_format = request.query_params.get(self.export_query_param, 'ndjson')
+        if export_format not in FORMATS:
+            return Response({'error': f'unsupported export format: {export_format}'}, status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(export_lines(export_format, self.get_queryset()),
+                                         content_type=FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="users.{export_format}"'
+        return response
+
     @action(methods=['post'], detail=False, url_path='change-avatar', url_name='change_avatar')
     def change_avatar(self, request):
         user = request.user
@@ -98,6 +154,26 @@ class UserViewSet(ListModelMixin,
         else:
             return Response({'allowed': False}, status=status.HTTP_200_OK)
 
+    @action(methods=['post'], detail=False, url_path='get-permissions', url_name='batch_permission')
+    def batch_permission(self, request):
+        '''
+        一次查询多个权限，结果按请求的顺序返回
+        {"permissions": [{"app": "account", "action": "view", "service": "user"}, ...]}
+        '''
+        user = request.user
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = []
+        for item in serializer.validated_data.get('permissions'):
+            app, action_name, service = item.get('app'), item.get('action'), item.get('service')
+            results.append({
+                'app': app,
+                'action': action_name,
+                'service': service,
+                'allowed': user.has_perm(f'{app}.{action_name}_{service}'),
+            })
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
 
 class UserInfoView(GenericAPIView):
     serializer_class = UserInfoSerializer
@@ -115,3 +191,46 @@ class PermissionsView(GenericAPIView):
         user = request.user
         serializer = self.get_serializer(user)
         return Response(serializer.data)
+
+
+class PermissionCatalogView(APIView):
+    """
+    权限目录：JWT 中 perms 位图的下标与权限名的对应关系，以及目录的版本
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, *args, **kwargs):
+        catalog = get_permission_catalog()
+        if request.META.get('HTTP_IF_NONE_MATCH') == f'"{catalog.version}"':
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        response = Response({
+            'version': catalog.version,
+            'permissions': {pk: name for pk, name in sorted(catalog.names.items())},
+        })
+        response['ETag'] = f'"{catalog.version}"'
+        return response
+
+
+class LogoutView(APIView):
+    """
+    吊销当前请求使用的 JWT
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.auth, dict) or not revoke_token(request.auth, request.user):
+            return Response({'error': 'token can not be revoked'}, status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CacheStatsView(APIView):
+    """
+    本进程各缓存的命中/未命中计数，以及登录哈希线程池的排队、计算时间
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        data = {name: stats.as_dict() for name, stats in CACHE_STATS.items()}
+        data['login_hashing'] = hashing_pool.stats.as_dict()
+        return Response(data)
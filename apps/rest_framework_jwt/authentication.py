@@ -1,6 +1,7 @@
 import jwt
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
 from django.utils.encoding import smart_text
 from django.utils.translation import ugettext as _
 from rest_framework import exceptions
@@ -8,7 +9,9 @@ from rest_framework.authentication import (
     BaseAuthentication, get_authorization_header
 )
 
+from rest_framework_jwt.cache import get_principal
 from rest_framework_jwt.settings import api_settings
+from rest_framework_jwt.utils import jwt_is_revoked
 
 
 jwt_decode_handler = api_settings.JWT_DECODE_HANDLER
@@ -39,6 +42,14 @@ class BaseJSONWebTokenAuthentication(BaseAuthentication):
             raise exceptions.AuthenticationFailed(msg)
         except jwt.InvalidTokenError:
             raise exceptions.AuthenticationFailed()
+        except ObjectDoesNotExist:
+            # The per-user secret of a deleted user, see JWT_GET_USER_SECRET_KEY
+            msg = _('Invalid signature.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        if jwt_is_revoked(payload):
+            msg = _('Token has been revoked.')
+            raise exceptions.AuthenticationFailed(msg)
 
         user = self.authenticate_credentials(payload)
 
@@ -56,7 +67,7 @@ class BaseJSONWebTokenAuthentication(BaseAuthentication):
             raise exceptions.AuthenticationFailed(msg)
 
         try:
-            user = User.objects.get_by_natural_key(username)
+            user = get_principal(username)
         except User.DoesNotExist:
             msg = _('Invalid signature.')
             raise exceptions.AuthenticationFailed(msg)
@@ -0,0 +1,179 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from rest_framework_jwt.settings import api_settings
+
+
+USER_KEY = 'jwt:%s:%s'
+USERNAME_KEY = 'jwt:username:%s'
+SECRET_KEY = 'jwt:secret:%s'
+KINDS = ('user', 'principal')
+
+
+def _get_cache():
+    alias = api_settings.JWT_USER_CACHE
+    return caches[alias] if alias else None
+
+
+def _username_key(kind, username):
+    # usernames may contain characters that are not valid in memcached keys
+    return USER_KEY % (kind, hashlib.sha1(username.encode('utf-8')).hexdigest())
+
+
+def _cached_fields(User):
+    names = api_settings.JWT_USER_CACHE_FIELDS
+    fields = [
+        field for field in User._meta.concrete_fields
+        if (field.name in names if names is not None else field.name != 'password')
+    ]
+    if User._meta.pk not in fields:
+        fields.insert(0, User._meta.pk)
+    return fields
+
+
+def _dump_user(user):
+    return {field.attname: getattr(user, field.attname) for field in _cached_fields(type(user))}
+
+
+def _restore_user(data):
+    # values must follow the order of the model's concrete fields
+    return get_user_model().from_db(DEFAULT_DB_ALIAS, list(data), list(data.values()))
+
+
+def _get_cached(kind, username, load, dump, restore):
+    cache = _get_cache()
+    if cache is None:
+        return load(username)
+
+    key = _username_key(kind, username)
+    data = cache.get(key)
+    if data is None:
+        user = load(username)
+        timeout = api_settings.JWT_USER_CACHE_TIMEOUT
+        cache.set_many({key: dump(user), USERNAME_KEY % user.pk: username}, timeout)
+        return user
+    return restore(data)
+
+
+def get_user_by_natural_key(username):
+    """
+    Returns the user for `username`, from the cache when `JWT_USER_CACHE` is
+    set. Fields that are not cached are deferred and loaded on access.
+
+    Raises `User.DoesNotExist` like `User.objects.get_by_natural_key`.
+    """
+    return _get_cached('user', username, get_user_model().objects.get_by_natural_key,
+                       _dump_user, _restore_user)
+
+
+def get_principal(username):
+    """
+    Returns the object `JSONWebTokenAuthentication` authenticates as.
+
+    That is an instance of `JWT_PRINCIPAL_CLASS` when set, which must provide
+    `from_username(username)`, `dump()` and `restore(data)`, and otherwise
+    the user itself.
+    """
+    principal_class = api_settings.JWT_PRINCIPAL_CLASS
+    if principal_class is None:
+        return get_user_by_natural_key(username)
+    return _get_cached('principal', username, principal_class.from_username,
+                       lambda principal: principal.dump(), principal_class.restore)
+
+
+class SecretStore(object):
+    """
+    Per-user signing secrets returned by `JWT_GET_USER_SECRET_KEY`, kept in
+    a bounded in-process LRU for `JWT_USER_SECRET_MEMORY_TTL` seconds and in
+    the `JWT_USER_CACHE` cache for `JWT_USER_CACHE_TIMEOUT` seconds.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        cache = _get_cache()
+        secret = cache.get(SECRET_KEY % user_id) if cache is not None else None
+        if secret is None:
+            user = get_user_model()._default_manager.get(pk=user_id)
+            secret = str(api_settings.JWT_GET_USER_SECRET_KEY(user))
+            if cache is not None:
+                cache.set(SECRET_KEY % user_id, secret, api_settings.JWT_USER_CACHE_TIMEOUT)
+        self._remember(user_id, secret)
+        return secret
+
+    def _remember(self, user_id, secret):
+        size = api_settings.JWT_USER_SECRET_CACHE_SIZE
+        if not size:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + api_settings.JWT_USER_SECRET_MEMORY_TTL, secret)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        cache = _get_cache()
+        if cache is not None:
+            cache.delete(SECRET_KEY % user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+secret_store = SecretStore()
+
+
+def get_user_secret(user_id):
+    """
+    Returns the signing secret of the user with `user_id`. Once cached, no
+    query is made. Raises `User.DoesNotExist` for an unknown user.
+    """
+    return secret_store.get(user_id)
+
+
+def invalidate_user_secret(user_id):
+    """
+    Drops the cached secret of a user after it was rotated. It is dropped
+    again when the transaction commits, so a secret read concurrently from
+    the old row is not kept. Other workers drop their in-process copy within
+    `JWT_USER_SECRET_MEMORY_TTL` seconds.
+    """
+    secret_store.invalidate(user_id)
+    transaction.on_commit(lambda: secret_store.invalidate(user_id))
+
+
+def invalidate_cached_user(user):
+    """
+    Drops `user` from the cache, including the entries for a previous
+    username if it was renamed, and its cached signing secret. Connect it to
+    the user model's `post_save` and `post_delete` signals.
+    """
+    if api_settings.JWT_GET_USER_SECRET_KEY:
+        invalidate_user_secret(user.pk)
+    cache = _get_cache()
+    if cache is None:
+        return
+    usernames = [user.get_username()]
+    previous = cache.get(USERNAME_KEY % user.pk)
+    if previous:
+        usernames.append(previous)
+    keys = [_username_key(kind, username) for kind in KINDS for username in usernames]
+    cache.delete_many(keys + [USERNAME_KEY % user.pk])
@@ -0,0 +1,112 @@
+import base64
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.serialization import (
+    load_pem_private_key, load_pem_public_key
+)
+
+from rest_framework_jwt.settings import api_settings
+
+
+EC_CURVES = {
+    'secp256r1': 'P-256',
+    'secp384r1': 'P-384',
+    'secp521r1': 'P-521',
+}
+
+
+def _load_key(value, loader):
+    if value is None or not isinstance(value, (str, bytes)):
+        return value
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    if loader is load_pem_private_key:
+        return loader(value, None, default_backend())
+    return loader(value, default_backend())
+
+
+def _b64(number, length):
+    data = number.to_bytes(length, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def public_key_to_jwk(public_key):
+    """
+    Returns the public JWK members for an RSA or EC public key.
+    """
+    numbers = public_key.public_numbers()
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return {
+            'kty': 'RSA',
+            'n': _b64(numbers.n, (numbers.n.bit_length() + 7) // 8),
+            'e': _b64(numbers.e, (numbers.e.bit_length() + 7) // 8),
+        }
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        length = (public_key.curve.key_size + 7) // 8
+        return {
+            'kty': 'EC',
+            'crv': EC_CURVES[public_key.curve.name],
+            'x': _b64(numbers.x, length),
+            'y': _b64(numbers.y, length),
+        }
+    raise ValueError('Unsupported key type: %s' % type(public_key).__name__)
+
+
+class SigningKey(object):
+
+    def __init__(self, kid, algorithm, public_key=None, private_key=None):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = _load_key(private_key, load_pem_private_key)
+        self.public_key = _load_key(public_key, load_pem_public_key)
+        if self.public_key is None and self.private_key is not None:
+            self.public_key = self.private_key.public_key()
+
+    def to_jwk(self):
+        jwk = public_key_to_jwk(self.public_key)
+        jwk.update({'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'})
+        return jwk
+
+
+class KeyRing(object):
+    """
+    The keys in `JWT_SIGNING_KEYS`, e.g.:
+
+        'JWT_SIGNING_KEYS': [
+            {'kid': '2019-05', 'algorithm': 'RS256', 'private_key': '-----BEGIN ...'},
+            {'kid': '2019-01', 'algorithm': 'ES256', 'public_key': '-----BEGIN ...'},
+        ]
+
+    New tokens are signed with the first key that has a private key and carry
+    its `kid` header. Every key verifies tokens and is published in the JWKS,
+    so a key can stay in the ring after rotation until its tokens expire.
+    """
+
+    def __init__(self, entries):
+        self.keys = [SigningKey(**entry) for entry in entries]
+        self.by_kid = {key.kid: key for key in self.keys}
+        self.signing_key = next((key for key in self.keys if key.private_key is not None), None)
+
+    def get(self, kid):
+        return self.by_kid.get(kid)
+
+    def jwks(self):
+        return {'keys': [key.to_jwk() for key in self.keys]}
+
+
+_key_ring = (None, None)
+
+
+def get_key_ring():
+    """
+    Returns the `KeyRing` for `JWT_SIGNING_KEYS`, or None when no keys are
+    configured. PEM keys are parsed once per settings value.
+    """
+    global _key_ring
+    entries = api_settings.JWT_SIGNING_KEYS
+    if not entries:
+        return None
+    if _key_ring[0] is not entries:
+        _key_ring = (entries, KeyRing(entries))
+    return _key_ring[1]
@@ -4,11 +4,14 @@ from calendar import timegm
 from datetime import datetime, timedelta
 
 from django.contrib.auth import authenticate, get_user_model
+from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import ugettext as _
 from rest_framework import serializers
 from .compat import Serializer
 
+from rest_framework_jwt.cache import get_user_by_natural_key
 from rest_framework_jwt.settings import api_settings
+from rest_framework_jwt.utils import jwt_is_revoked
 from rest_framework_jwt.compat import get_username_field, PasswordField
 
 
@@ -47,7 +50,9 @@ class JSONWebTokenSerializer(Serializer):
         }
 
         if all(credentials.values()):
-            user = authenticate(**credentials)
+            # Pass the request so that backends can tell a DRF login apart
+            # from other callers, e.g. to raise API exceptions
+            user = authenticate(request=self.context.get('request'), **credentials)
 
             if user:
                 if not user.is_active:
@@ -69,6 +74,34 @@ class JSONWebTokenSerializer(Serializer):
             raise serializers.ValidationError(msg)
 
 
+def check_payload(token):
+    """
+    Decodes `token`, raising a `ValidationError` when it has expired or is
+    invalid. Shared by the single and bulk verification serializers, so any
+    failure must become a `ValidationError`: one bad token must not fail a
+    whole bulk request.
+    """
+    try:
+        payload = jwt_decode_handler(token)
+    except jwt.ExpiredSignature:
+        msg = _('Signature has expired.')
+        raise serializers.ValidationError(msg)
+    except jwt.InvalidTokenError:
+        # DecodeError, and also a wrong algorithm, audience or issuer
+        msg = _('Error decoding signature.')
+        raise serializers.ValidationError(msg)
+    except ObjectDoesNotExist:
+        # The per-user secret of a deleted user, see JWT_GET_USER_SECRET_KEY
+        msg = _("User doesn't exist.")
+        raise serializers.ValidationError(msg)
+
+    if jwt_is_revoked(payload):
+        msg = _('Token has been revoked.')
+        raise serializers.ValidationError(msg)
+
+    return payload
+
+
 class VerificationBaseSerializer(Serializer):
     """
     Abstract serializer used for verifying and refreshing JWTs.
@@ -82,16 +115,7 @@ class VerificationBaseSerializer(Serializer):
     def _check_payload(self, token):
         # Check payload valid (based off of JSONWebTokenAuthentication,
         # may want to refactor)
-        try:
-            payload = jwt_decode_handler(token)
-        except jwt.ExpiredSignature:
-            msg = _('Signature has expired.')
-            raise serializers.ValidationError(msg)
-        except jwt.DecodeError:
-            msg = _('Error decoding signature.')
-            raise serializers.ValidationError(msg)
-
-        return payload
+        return check_payload(token)
 
     def _check_user(self, payload):
         username = jwt_get_username_from_payload(payload)
@@ -102,7 +126,7 @@ class VerificationBaseSerializer(Serializer):
 
         # Make sure user exists
         try:
-            user = User.objects.get_by_natural_key(username)
+            user = get_user_by_natural_key(username)
         except User.DoesNotExist:
             msg = _("User doesn't exist.")
             raise serializers.ValidationError(msg)
@@ -131,6 +155,64 @@ class VerifyJSONWebTokenSerializer(VerificationBaseSerializer):
         }
 
 
+class BulkVerifyJSONWebTokenSerializer(Serializer):
+    """
+    Check the veracity of up to `JWT_BULK_VERIFY_MAX_TOKENS` access tokens.
+
+    Every token gets a result, in the order given, with `valid`, `exp`,
+    `username` and, for invalid tokens, an `error`. The users of all tokens
+    are looked up with a single query.
+    """
+    tokens = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+    def validate_tokens(self, tokens):
+        limit = api_settings.JWT_BULK_VERIFY_MAX_TOKENS
+        if len(tokens) > limit:
+            msg = _('Ensure this field has no more than {limit} tokens.')
+            raise serializers.ValidationError(msg.format(limit=limit))
+        return tokens
+
+    def _get_active_users(self, usernames):
+        username_field = get_username_field()
+        users = User._default_manager.filter(**{username_field + '__in': usernames})
+        return dict(users.values_list(username_field, 'is_active'))
+
+    def validate(self, attrs):
+        payloads = []
+        for token in attrs['tokens']:
+            try:
+                payloads.append(check_payload(token))
+            except serializers.ValidationError as exc:
+                payloads.append(exc.detail[0])
+
+        usernames = {
+            jwt_get_username_from_payload(payload)
+            for payload in payloads if isinstance(payload, dict)
+        }
+        active = self._get_active_users(usernames - {None, ''})
+
+        results = []
+        for payload in payloads:
+            if not isinstance(payload, dict):
+                results.append({'valid': False, 'exp': None, 'username': None, 'error': payload})
+                continue
+            username = jwt_get_username_from_payload(payload)
+            if not username:
+                error = _('Invalid payload.')
+            elif username not in active:
+                error = _("User doesn't exist.")
+            elif not active[username]:
+                error = _('User account is disabled.')
+            else:
+                error = None
+            result = {'valid': error is None, 'exp': payload.get('exp'), 'username': username}
+            if error is not None:
+                result['error'] = error
+            results.append(result)
+
+        return {'results': results}
+
+
 class RefreshJSONWebTokenSerializer(VerificationBaseSerializer):
     """
     Refresh an access token.
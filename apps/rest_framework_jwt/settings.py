@@ -1,11 +1,9 @@
 import datetime
 
 from django.conf import settings
+from django.test.signals import setting_changed
 from rest_framework.settings import APISettings
 
-
-USER_SETTINGS = getattr(settings, 'JWT_AUTH', None)
-
 DEFAULTS = {
     'JWT_ENCODE_HANDLER':
     'rest_framework_jwt.utils.jwt_encode_handler',
@@ -32,6 +30,9 @@ DEFAULTS = {
     'rest_framework_jwt.utils.jwt_response_payload_handler',
 
     'JWT_SECRET_KEY': settings.SECRET_KEY,
+    # Callable taking a user and returning its own signing secret. Only used
+    # for tokens signed with a shared secret: it cannot be combined with
+    # JWT_SIGNING_KEYS or JWT_PRIVATE_KEY, whose tokens never consult it.
     'JWT_GET_USER_SECRET_KEY': None,
     'JWT_ALGORITHM': 'HS256',
     'JWT_VERIFY': True,
@@ -46,6 +47,54 @@ DEFAULTS = {
 
     'JWT_AUTH_HEADER_PREFIX': 'JWT',
     'JWT_AUTH_COOKIE': None,
+
+    # Cache of verified payloads keyed by a hash of the token, 0 disables it.
+    # Entries expire after JWT_DECODE_CACHE_TTL seconds or at the token's
+    # `exp`, whichever comes first.
+    'JWT_DECODE_CACHE_SIZE': 0,
+    'JWT_DECODE_CACHE_TTL': 60,
+
+    # Django cache alias used to cache users looked up by username, None
+    # disables it. JWT_USER_CACHE_FIELDS lists the fields kept in the cache,
+    # None means every concrete field except the password; the others are
+    # loaded on access. The cache must be shared by all workers (Redis,
+    # Memcached, ...): saving or deleting a user only invalidates it in the
+    # worker that handled the change, so a per-process LocMemCache keeps
+    # deactivated users authenticating elsewhere for JWT_USER_CACHE_TIMEOUT.
+    'JWT_USER_CACHE': None,
+    'JWT_USER_CACHE_TIMEOUT': 300,
+    'JWT_USER_CACHE_FIELDS': None,
+
+    # In-process cache of the secrets returned by JWT_GET_USER_SECRET_KEY,
+    # in front of JWT_USER_CACHE. A rotated secret is dropped at once in the
+    # worker that rotated it and in JWT_USER_CACHE, and after at most
+    # JWT_USER_SECRET_MEMORY_TTL seconds in the other workers. This only
+    # holds when JWT_USER_CACHE is shared by all workers or None: a
+    # per-process cache keeps the old secret for JWT_USER_CACHE_TIMEOUT.
+    'JWT_USER_SECRET_CACHE_SIZE': 10000,
+    'JWT_USER_SECRET_MEMORY_TTL': 5,
+
+    # Class that JSONWebTokenAuthentication returns instead of the user
+    # model, e.g. a lightweight object that loads the full user lazily.
+    'JWT_PRINCIPAL_CLASS': None,
+
+    # Callable taking a verified payload and returning True when the token
+    # has been revoked, e.g. 'account.revocation.is_token_revoked'
+    'JWT_REVOCATION_HANDLER': None,
+
+    # Throttle classes of ObtainJSONWebToken, checked before the credentials
+    # are authenticated
+    'JWT_AUTH_THROTTLE_CLASSES': [],
+
+    # Maximum number of tokens accepted by the bulk verify endpoint
+    'JWT_BULK_VERIFY_MAX_TOKENS': 100,
+
+    # Key ring for asymmetric signing with a `kid` header, see
+    # rest_framework_jwt.keys.KeyRing. When empty, tokens are signed with
+    # JWT_PRIVATE_KEY or the secret key using JWT_ALGORITHM.
+    'JWT_SIGNING_KEYS': [],
+    # Cache-Control max-age of the JWKS endpoint
+    'JWT_JWKS_MAX_AGE': 60 * 60 * 24,
 }
 
 # List of settings that may be in string import notation.
@@ -57,6 +106,27 @@ IMPORT_STRINGS = (
     'JWT_PAYLOAD_GET_USERNAME_HANDLER',
     'JWT_RESPONSE_PAYLOAD_HANDLER',
     'JWT_GET_USER_SECRET_KEY',
+    'JWT_PRINCIPAL_CLASS',
+    'JWT_REVOCATION_HANDLER',
+    'JWT_AUTH_THROTTLE_CLASSES',
 )
 
-api_settings = APISettings(USER_SETTINGS, DEFAULTS, IMPORT_STRINGS)
+
+class JWTSettings(APISettings):
+
+    @property
+    def user_settings(self):
+        if not hasattr(self, '_user_settings'):
+            self._user_settings = getattr(settings, 'JWT_AUTH', {}) or {}
+        return self._user_settings
+
+
+api_settings = JWTSettings(None, DEFAULTS, IMPORT_STRINGS)
+
+
+def reload_api_settings(*args, **kwargs):
+    if kwargs['setting'] == 'JWT_AUTH':
+        api_settings.reload()
+
+
+setting_changed.connect(reload_api_settings)
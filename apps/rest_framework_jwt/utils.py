@@ -1,17 +1,115 @@
 import jwt
 import uuid
+import time
+import hashlib
+import threading
 import warnings
 
-from django.contrib.auth import get_user_model
+from collections import OrderedDict
 
 from calendar import timegm
 from datetime import datetime
 
+from django.core.exceptions import ObjectDoesNotExist
+
+from rest_framework_jwt.cache import get_user_secret
 from rest_framework_jwt.compat import get_username
 from rest_framework_jwt.compat import get_username_field
+from rest_framework_jwt.keys import get_key_ring
 from rest_framework_jwt.settings import api_settings
 
 
+class PayloadCache(object):
+    """
+    Bounded LRU cache of verified payloads, keyed by a SHA-256 of the token.
+
+    Only payloads that passed signature verification are stored, and an
+    entry never outlives the token's `exp` claim, nor the key ring entry or
+    per-user secret it was verified with.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    def get(self, token):
+        if not api_settings.JWT_DECODE_CACHE_SIZE:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+        try:
+            stale = entry is not None and self._stale(entry)
+        except ObjectDoesNotExist:
+            stale = True
+        with self._lock:
+            if entry is not None and (stale or entry[0] <= time.time()):
+                self._entries.pop(key, None)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return dict(entry[1])
+
+    @staticmethod
+    def _stale(entry):
+        _, payload, secret, signing_key = entry
+        # verified with a key that has been removed from the key ring since
+        if signing_key is not None:
+            key_ring = get_key_ring()
+            if key_ring is None or key_ring.get(signing_key.kid) is not signing_key:
+                return True
+        # verified with a per-user secret that has been rotated since
+        return secret is not None and secret != jwt_get_secret_key(payload)
+
+    def set(self, token, payload, secret=None, signing_key=None):
+        """
+        `secret` is the per-user secret and `signing_key` the key ring entry
+        the token was verified with, if any; the entry is dropped once that
+        secret changes or that key leaves the key ring.
+        """
+        size = api_settings.JWT_DECODE_CACHE_SIZE
+        if not size:
+            return
+        expires = time.time() + api_settings.JWT_DECODE_CACHE_TTL
+        if 'exp' in payload:
+            expires = min(expires, payload['exp'])
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires, dict(payload), secret, signing_key)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+        }
+
+
+jwt_decode_cache = PayloadCache()
+
+
 def jwt_get_secret_key(payload=None):
     """
     For enhanced security you may want to use a secret key based on user.
@@ -22,10 +120,7 @@ def jwt_get_secret_key(payload=None):
         - etc.
     """
     if api_settings.JWT_GET_USER_SECRET_KEY:
-        User = get_user_model()  # noqa: N806
-        user = User.objects.get(pk=payload.get('user_id'))
-        key = str(api_settings.JWT_GET_USER_SECRET_KEY(user))
-        return key
+        return get_user_secret(payload.get('user_id'))
     return api_settings.JWT_SECRET_KEY
 
 
@@ -42,7 +137,9 @@ def jwt_payload_handler(user):
     payload = {
         'user_id': user.pk,
         'username': username,
-        'exp': datetime.utcnow() + api_settings.JWT_EXPIRATION_DELTA
+        'exp': datetime.utcnow() + api_settings.JWT_EXPIRATION_DELTA,
+        # unique token id, lets a single token be revoked
+        'jti': uuid.uuid4().hex,
     }
     if hasattr(user, 'email'):
         payload['email'] = user.email
@@ -67,6 +164,14 @@ def jwt_payload_handler(user):
     return payload
 
 
+def jwt_is_revoked(payload):
+    """
+    Returns True when `JWT_REVOCATION_HANDLER` reports the token as revoked.
+    """
+    handler = api_settings.JWT_REVOCATION_HANDLER
+    return handler is not None and handler(payload)
+
+
 def jwt_get_user_id_from_payload_handler(payload):
     """
     Override this function if user_id is formatted differently in payload
@@ -88,6 +193,16 @@ def jwt_get_username_from_payload_handler(payload):
 
 
 def jwt_encode_handler(payload):
+    key_ring = get_key_ring()
+    if key_ring is not None and key_ring.signing_key is not None:
+        signing_key = key_ring.signing_key
+        return jwt.encode(
+            payload,
+            signing_key.private_key,
+            signing_key.algorithm,
+            headers={'kid': signing_key.kid}
+        ).decode('utf-8')
+
     key = api_settings.JWT_PRIVATE_KEY or jwt_get_secret_key(payload)
     return jwt.encode(
         payload,
@@ -97,22 +212,44 @@ def jwt_encode_handler(payload):
 
 
 def jwt_decode_handler(token):
+    payload = jwt_decode_cache.get(token)
+    if payload is not None:
+        return payload
+
     options = {
         'verify_exp': api_settings.JWT_VERIFY_EXPIRATION,
     }
-    # get user from token, BEFORE verification, to get user secret key
-    unverified_payload = jwt.decode(token, None, False)
-    secret_key = jwt_get_secret_key(unverified_payload)
-    return jwt.decode(
+    secret = signing_key = None
+    kid = jwt.get_unverified_header(token).get('kid')
+    if kid is not None:
+        # signed by a key of the key ring
+        key_ring = get_key_ring()
+        signing_key = key_ring and key_ring.get(kid)
+        if signing_key is None:
+            raise jwt.DecodeError('Unknown key id.')
+        key, algorithm = signing_key.public_key, signing_key.algorithm
+    else:
+        # get user from token, BEFORE verification, to get user secret key
+        unverified_payload = jwt.decode(token, None, False)
+        if api_settings.JWT_PUBLIC_KEY:
+            key = api_settings.JWT_PUBLIC_KEY
+        else:
+            key = jwt_get_secret_key(unverified_payload)
+            if api_settings.JWT_GET_USER_SECRET_KEY:
+                secret = key
+        algorithm = api_settings.JWT_ALGORITHM
+    payload = jwt.decode(
         token,
-        api_settings.JWT_PUBLIC_KEY or secret_key,
+        key,
         api_settings.JWT_VERIFY,
         options=options,
         leeway=api_settings.JWT_LEEWAY,
         audience=api_settings.JWT_AUDIENCE,
         issuer=api_settings.JWT_ISSUER,
-        algorithms=[api_settings.JWT_ALGORITHM]
+        algorithms=[algorithm]
     )
+    jwt_decode_cache.set(token, payload, secret, signing_key)
+    return payload
 
 
 def jwt_response_payload_handler(token, user=None, request=None):
@@ -1,12 +1,14 @@
+from django.utils.cache import patch_cache_control
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
 from datetime import datetime
 
+from .keys import get_key_ring
 from .settings import api_settings
 from .serializers import (
     JSONWebTokenSerializer, RefreshJSONWebTokenSerializer,
-    VerifyJSONWebTokenSerializer
+    VerifyJSONWebTokenSerializer, BulkVerifyJSONWebTokenSerializer
 )
 
 jwt_response_payload_handler = api_settings.JWT_RESPONSE_PAYLOAD_HANDLER
@@ -79,6 +81,9 @@ class ObtainJSONWebToken(JSONWebTokenAPIView):
     """
     serializer_class = JSONWebTokenSerializer
 
+    def get_throttles(self):
+        return [throttle() for throttle in api_settings.JWT_AUTH_THROTTLE_CLASSES]
+
 
 class VerifyJSONWebToken(JSONWebTokenAPIView):
     """
@@ -88,6 +93,22 @@ class VerifyJSONWebToken(JSONWebTokenAPIView):
     serializer_class = VerifyJSONWebTokenSerializer
 
 
+class BulkVerifyJSONWebToken(JSONWebTokenAPIView):
+    """
+    API View that receives a POST with a list of tokens and returns, for each
+    token, whether it is valid, its expiration and username.
+    """
+    serializer_class = BulkVerifyJSONWebTokenSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+
+        if serializer.is_valid():
+            return Response(serializer.object)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class RefreshJSONWebToken(JSONWebTokenAPIView):
     """
     API View that returns a refreshed token (with new expiration) based on
@@ -99,6 +120,23 @@ class RefreshJSONWebToken(JSONWebTokenAPIView):
     serializer_class = RefreshJSONWebTokenSerializer
 
 
+class JSONWebKeySet(APIView):
+    """
+    API View that publishes the public keys of `JWT_SIGNING_KEYS` as a JWK
+    Set, so other services can verify tokens locally.
+    """
+    permission_classes = ()
+    authentication_classes = ()
+
+    def get(self, request, *args, **kwargs):
+        key_ring = get_key_ring()
+        response = Response(key_ring.jwks() if key_ring else {'keys': []})
+        patch_cache_control(response, public=True, max_age=api_settings.JWT_JWKS_MAX_AGE)
+        return response
+
+
 obtain_jwt_token = ObtainJSONWebToken.as_view()
 refresh_jwt_token = RefreshJSONWebToken.as_view()
 verify_jwt_token = VerifyJSONWebToken.as_view()
+bulk_verify_jwt_token = BulkVerifyJSONWebToken.as_view()
+jwks_jwt_token = JSONWebKeySet.as_view()
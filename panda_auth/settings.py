@@ -49,11 +49,12 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # 带 JWT 的 API 请求跳过会话、CSRF 和消息，见 account.middleware
+    'account.middleware.FastLaneSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
+    'account.middleware.FastLaneCsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'account.middleware.FastLaneMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -159,18 +160,40 @@ CORS_ORIGIN_ALLOW_ALL = True
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         # 'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        'account.middleware.BrowserSessionAuthentication',
         'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
     ),
     'DATETIME_FORMAT': 'iso-8601',
     'DATETIME_INPUT_FORMATS': ('iso-8601',),
     'UPLOADED_FILES_USE_URL': True,
+    # 前面反向代理的层数，登录限流等按 IP 计数时用 X-Forwarded-For 中倒数第 NUM_PROXIES 个地址；
+    # 0 表示只用 REMOTE_ADDR。为 None 时直接使用客户端可以伪造的 X-Forwarded-For
+    'NUM_PROXIES': 0,
     }
 
 JWT_AUTH = {
     'JWT_SECRET_KEY': 'dh@8jt0ki-maw(tzx#pt-si$c9mdxt7$0$&)yu!0k$&e-',
     'JWT_ALLOW_REFRESH': True,
     'JWT_EXPIRATION_DELTA': datetime.timedelta(days=3),
-    # 'JWT_RESPONSE_PAYLOAD_HANDLER': 'account.utils.jwt_response_payload_handler',
+    # 登录时带上 ?bootstrap=1 返回前端启动需要的数据，刷新只返回 token
+    'JWT_RESPONSE_PAYLOAD_HANDLER': 'account.utils.jwt_response_payload_handler',
+    'JWT_PAYLOAD_HANDLER': 'account.utils.jwt_payload_handler',
     # 'JWT_LEEWAY': datetime.timedelta(hours=2)
-}
\ No newline at end of file
+    'JWT_DECODE_CACHE_SIZE': 10000,
+    'JWT_DECODE_CACHE_TTL': 60 * 5,
+    # 缓存 token 对应的用户，需要所有进程共享的缓存（同 ACCOUNT['PERMISSION_CACHE']）：
+    # 停用、删除用户时只有处理修改的进程会清除缓存
+    # 'JWT_USER_CACHE': 'shared',
+    'JWT_REVOCATION_HANDLER': 'account.revocation.is_token_revoked',
+    'JWT_AUTH_THROTTLE_CLASSES': ['account.throttling.LoginThrottle'],
+    # 每个用户单独的签名密钥，User.rotate_secret() 可在所有设备上退出登录
+    # 'JWT_GET_USER_SECRET_KEY': 'account.utils.jwt_get_user_secret_key',
+}
+
+# Account
+ACCOUNT = {
+    'PERMISSION_RESOLUTION': 'union',
+    # 跨请求缓存权限和菜单，需要所有进程共享的缓存，不能用默认的 LocMemCache，例如：
+    # CACHES = {'shared': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}}
+    # 'PERMISSION_CACHE': 'shared',
+}
@@ -20,7 +20,9 @@ from django.urls import path, include
 from rest_framework.documentation import include_docs_urls
 from rest_framework_jwt.views import (obtain_jwt_token,
                                       refresh_jwt_token,
-                                      verify_jwt_token)
+                                      verify_jwt_token,
+                                      bulk_verify_jwt_token,
+                                      jwks_jwt_token)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -32,6 +34,8 @@ urlpatterns = [
     path('jwt/auth/',    obtain_jwt_token),
     path('jwt/refresh/', refresh_jwt_token),
     path('jwt/verify/',  verify_jwt_token),
+    path('jwt/verify/bulk/', bulk_verify_jwt_token),
+    path('jwt/jwks/',    jwks_jwt_token),
 
     # account
     path('account/', include('account.urls', namespace='account')),